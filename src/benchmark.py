@@ -0,0 +1,119 @@
+import json
+import os
+import time
+import pyomo.environ as pe
+from lci import LifeCycleInventory
+from utils.solve_model import Solver
+from utils.profiling import profiler
+from utils.inventory_cache import cache_filename, inventory_key
+from utils.synthetic import synthetic_inventory, write_inventory_excel, synthetic_superstructure, \
+    import_synthetic_lci, connector_flows
+
+""" Scaling benchmark on synthetic inventories and flowsheets (no licensed data required) """
+
+# Problem sizes: intermediate flows, processes, density of A, parallel trains of the flowsheet
+sizes = [{'flows': 50, 'processes': 100, 'density': 0.05, 'trains': 1},
+         {'flows': 200, 'processes': 500, 'density': 0.02, 'trains': 2},
+         {'flows': 1000, 'processes': 2500, 'density': 0.005, 'trains': 4},
+         {'flows': 3000, 'processes': 8000, 'density': 0.002, 'trains': 8}]
+
+scale = 1000000000
+tcm_solver_name = 'glpk'  # 'matrix' solves the TCM with HiGHS
+solve_gdp = True  # False: build the combined model only
+benchmark_dir = 'benchmark'
+benchmark_file = os.path.join(benchmark_dir, 'benchmark_results.json')  # All runs are appended here
+
+
+def run_size(size, seed=0):
+    """ Generates, builds and solves one problem size. Returns the wall times [s] and the solve results """
+    filename = os.path.join(benchmark_dir, 'synthetic_{flows}_{processes}.xlsx'.format(**size))
+    if not os.path.isfile(filename):
+        write_inventory_excel(filename, synthetic_inventory(size['flows'], size['processes'], density=size['density'],
+                                                            connectors=connector_flows, seed=seed))
+    timing = {}
+    profiler.reset()
+
+    cache_file = cache_filename(filename, inventory_key(filename, 'A-Matrix', 'End of life'))
+    if os.path.isfile(cache_file):
+        os.remove(cache_file)  # The first import parses the workbook and writes the cache file
+    start = time.perf_counter()
+    lci = LifeCycleInventory('synthetic')
+    lci.import_from_excel(filename, 'A-Matrix', 'End of life')
+    timing['import'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lci.import_from_excel(filename, 'A-Matrix', 'End of life')  # Second call reads the cache file
+    timing['import (cached)'] = time.perf_counter() - start
+
+    'TCM'
+    start = time.perf_counter()
+    if tcm_solver_name != 'matrix':
+        lci.model = pe.ConcreteModel('synthetic')
+        lci.set_up_lp(scale)
+        lci.construct_demand_constraints()
+        lci.construct_objective()
+        lci.model.add_component('lp', lci.lp)
+    timing['lp build'] = time.perf_counter() - start
+
+    solver = Solver()
+    start = time.perf_counter()
+    if tcm_solver_name == 'matrix':
+        record = None
+        lci.scale = scale
+        solver.solve_matrix(lci)
+    else:
+        record = solver.solve_lp(lci, tcm_solver_name)
+    timing['tcm solve'] = time.perf_counter() - start
+    result = {'size': size, 'timing': timing,
+              'tcm': None if record is None else {'ok': record.ok, 'z': record.incumbent}}
+
+    'Combined model'
+    start = time.perf_counter()
+    s = synthetic_superstructure(size['trains'], scale)
+    lci_gdp = LifeCycleInventory('synthetic')
+    lci_gdp.import_from_excel(filename, 'A-Matrix', 'End of life')
+    lci_gdp.set_up_lp(scale)
+    import_synthetic_lci(s, lci_gdp)
+    timing['gdp build'] = time.perf_counter() - start
+
+    if solve_gdp:
+        record = Solver().solve_gdp(s)
+        timing['gdp solve'] = record.wall_time
+        result['gdp'] = {'ok': record.ok, 'z': record.incumbent, 'iterations': record.iterations}
+
+    result['phases'] = profiler.summary()
+    return result
+
+
+def compare(run, previous):
+    """ Prints the wall times of run relative to the previous run of the same size """
+    for r in run['results']:
+        for p in previous['results']:
+            if p['size'] == r['size']:
+                for phase in r['timing'].keys():
+                    if phase in p['timing'].keys() and p['timing'][phase] > 0:
+                        ratio = r['timing'][phase] / p['timing'][phase]
+                        print('{flows:>6} flows {processes:>6} processes'.format(**r['size']),
+                              '{:<16} {:8.3f} s ({:5.2f} x previous)'.format(phase, r['timing'][phase], ratio))
+
+
+if __name__ == '__main__':
+
+    if not os.path.isdir(benchmark_dir):
+        os.makedirs(benchmark_dir)
+    profiler.enable(memory=False)
+
+    run = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'tcm_solver': tcm_solver_name, 'results': []}
+    for size in sizes:
+        run['results'].append(run_size(size))
+        print(size, run['results'][-1]['timing'])
+
+    runs = []
+    if os.path.isfile(benchmark_file):
+        with open(benchmark_file) as input:
+            runs = json.load(input)
+    if runs:
+        compare(run, runs[-1])
+    runs.append(run)
+    with open(benchmark_file, 'w') as output:
+        json.dump(runs, output, indent=2)
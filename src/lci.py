@@ -1,6 +1,12 @@
 import pandas as pd
 import pyomo.environ as pe
 import numpy as np
+from scipy import sparse
+from pyomo.core.expr.numeric_expr import LinearExpression
+from pyomo.common.collections import ComponentMap
+from utils.inventory_cache import inventory_key, cache_filename, load_inventory, save_inventory
+from utils.profiling import profiler
+from utils.scaling import jacobian, scaling_factors, apply_scaling, jacobian_statistics, no_worse
 
 
 def is_empty_cell(c):
@@ -120,6 +126,24 @@ def weighted_sum_positive(par, var, ind):
 
     return ws
 
+def _geometric_mean_scale(M):
+    """ 1 / sqrt(max * min) of the absolute nonzero entries of each row of the csr matrix M, 1 for empty rows """
+    factors = np.ones(M.shape[0])
+    nonempty = np.flatnonzero(np.diff(M.indptr) > 0)
+    if len(nonempty) > 0:
+        data = np.abs(M.data)
+        starts = M.indptr[nonempty]
+        factors[nonempty] = 1 / np.sqrt(np.maximum.reduceat(data, starts) * np.minimum.reduceat(data, starts))
+    return factors
+
+
+def _entry_ratio(M):
+    """ Ratio of the largest and smallest absolute nonzero entry of a sparse matrix """
+    data = np.abs(sparse.csr_matrix(M).data)
+    data = data[data > 0]
+    return float(data.max() / data.min()) if len(data) > 0 else 1.0
+
+
 class LifeCycleInventory:
     """
 
@@ -137,6 +161,17 @@ class LifeCycleInventory:
         self.lp = None
         self.connector = {}
         self.scale = None
+        self.deactivated = set()  # Processes switched off by deactivate_process
+        self.process_caps = {}  # Upper bounds on single processes, e.g. ammonia plant
+        self.changed_processes = set()  # Bounds changed since the last push to a persistent solver
+        self.changed_impacts = False  # Elementary flows changed since the last push to a persistent solver
+        self.changed_constraints = False  # Demand constraints rebuilt since the last push to a persistent solver
+        self.tightened = False  # Variable bounds derived from the current processes, see Solver.tighten_bounds
+        self.active_processes = None  # Presolve: mask of processes, which can carry flow
+        self.active_flows = None  # Presolve: mask of intermediate flows, which remain as constraints
+        self.pruned = set()  # Presolve: processes implied to be zero by the current scenario
+        self.row_scale = None  # Equilibration: factors of the rows (flows) and columns (processes) of A
+        self.col_scale = None
 
         self.model = None
         self.objective = None
@@ -146,7 +181,33 @@ class LifeCycleInventory:
     def import_connector(self, connector):
         self.connector = connector
 
-    def import_from_excel(self, filename, sheetname, sheetname2):
+    @profiler.profile('lci.import_from_excel')
+    def import_from_excel(self, filename, sheetname, sheetname2, cache=True, cache_dir=None):
+        """
+        Imports the inventory from excel. Parsed inventories are cached in a binary file next to the
+        workbook (or in cache_dir), keyed by a hash of the workbook and the sheet names
+        """
+        if cache:
+            key = inventory_key(filename, sheetname, sheetname2)
+            cache_file = cache_filename(filename, key, cache_dir)
+            cached = load_inventory(cache_file, key)
+            if cached is not None:
+                self.A = cached['A']
+                self.m, self.n = self.A.shape
+                self.p = cached['p']
+                self.b = cached['b']
+                self.v = cached['v']
+                self.processes = cached['processes']
+                self.intermediate_flows = cached['intermediate_flows']
+                return
+
+        self.parse_excel(filename, sheetname, sheetname2)
+
+        if cache:
+            save_inventory(cache_file, key, self)
+
+    @profiler.profile('lci.parse_excel')
+    def parse_excel(self, filename, sheetname, sheetname2):
 
         xls = pd.ExcelFile(filename)
         data = xls.parse(sheetname)
@@ -157,7 +218,7 @@ class LifeCycleInventory:
 
         self.p = df_to_list(data.iloc[14:14 + self.m, 1:2])  # Production capacity vector
 
-        self.A = data.iloc[14:14 + self.m, 2:2 + self.n]  # Technology matrix
+        self.A = sparse.csr_matrix(data.iloc[14:14 + self.m, 2:2 + self.n].fillna(0).to_numpy(dtype=float))  # Technology matrix (sparse)
 
         self.b = df_to_list(data.iloc[14 + self.m + 1:14 + self.m + 2, 2:2 + self.n])  # elementary flow vector
 
@@ -169,6 +230,77 @@ class LifeCycleInventory:
 
         self.v = df_to_list(data_endoflife.iloc[0:self.m, 11:12])  # End-of-life emissions vector
 
+    @profiler.profile('lci.equilibrate')
+    def equilibrate(self, passes=10):
+        """
+        Geometric-mean equilibration of the technology matrix: rows and columns of A are alternately scaled
+        by 1 / sqrt(max * min) of their absolute entries, the factors are rounded to powers of two.
+        The LP is then built with R A C, the elementary flows C b and the end-of-life emissions v / R,
+        so that its variables are s / C and R y. Values in the original units are returned by
+        process_level, flow_level and solution. Must be called before set_up_lp.
+        Returns the ratio of the largest and smallest absolute entry of A before and after
+        """
+        if self.lp is not None:
+            raise Warning('Equilibration must be applied before the lp is set up')
+        A = abs(sparse.csr_matrix(self.A, dtype=float))
+        A.eliminate_zeros()
+        m, n = A.shape
+        row_scale = np.ones(m)
+        col_scale = np.ones(n)
+        for _ in range(passes):
+            scaled = sparse.diags(row_scale).dot(A).dot(sparse.diags(col_scale))
+            r = _geometric_mean_scale(scaled.tocsr())
+            row_scale *= r
+            scaled = sparse.diags(row_scale).dot(A).dot(sparse.diags(col_scale))
+            c = _geometric_mean_scale(scaled.T.tocsr())
+            col_scale *= c
+            if np.abs(np.log2(r)).max(initial=0) < 0.5 and np.abs(np.log2(c)).max(initial=0) < 0.5:
+                break
+        self.row_scale = 2 ** np.round(np.log2(row_scale))
+        self.col_scale = 2 ** np.round(np.log2(col_scale))
+        return {'before': _entry_ratio(A), 'after': _entry_ratio(self.scaled_matrix())}
+
+    def scales(self):
+        """ Returns the row and column factors of the equilibration (ones if A is not equilibrated) """
+        if self.row_scale is None:
+            return np.ones(len(self.intermediate_flows)), np.ones(len(self.processes))
+        return self.row_scale, self.col_scale
+
+    def scaled_matrix(self):
+        """ Technology matrix as used in the lp, R A C (A if it is not equilibrated) """
+        if self.row_scale is None:
+            return sparse.csr_matrix(self.A)
+        return sparse.diags(self.row_scale).dot(sparse.csr_matrix(self.A)).dot(sparse.diags(self.col_scale)).tocsr()
+
+    def process_level(self, process_name):
+        """ Scaling factor s of a process in the solution of the lp, unscaled by the equilibration """
+        if self.col_scale is None:
+            return pe.value(self.lp.s[process_name])
+        return pe.value(self.lp.s[process_name]) * self.col_scale[self.processes.index(process_name)]
+
+    def flow_level(self, flow):
+        """ Intermediate flow y in the solution of the lp, unscaled by the equilibration """
+        if self.row_scale is None:
+            return pe.value(self.lp.y[flow])
+        return pe.value(self.lp.y[flow]) / self.row_scale[self.intermediate_flows.index(flow)]
+
+    def solution(self):
+        """ Returns s and y of the lp solution as arrays in the order of processes and intermediate_flows """
+        row_scale, col_scale = self.scales()
+        s = np.array([pe.value(self.lp.s[p]) for p in self.processes]) * col_scale
+        y = np.array([pe.value(self.lp.y[f]) for f in self.intermediate_flows]) / row_scale
+        return s, y
+
+    def load_solution(self, s, y):
+        """ Loads s and y (original units) into the lp variables, e.g. after solve_matrix """
+        row_scale, col_scale = self.scales()
+        for j, process_name in enumerate(self.processes):
+            self.lp.s[process_name].set_value(s[j] / col_scale[j])
+        for u, flow in enumerate(self.intermediate_flows):
+            self.lp.y[flow].set_value(y[u] * row_scale[u])
+        self.lp.obj_gate2grave.set_value(np.dot(self.v, y))
+
+    @profiler.profile('lci.set_up_lp')
     def set_up_lp(self, scale):
 
         self.scale = scale
@@ -183,9 +315,20 @@ class LifeCycleInventory:
         self.lp.y = pe.Var(self.lp.y_set, initialize=0, bounds=(-ub, ub))  # Mill gas balance causes negative d
         self.lp.y.construct()
 
-        self.lp.obj_cradle2gate = pe.Var(initialize=0, bounds=(-ub, ub))
         self.lp.obj_gate2grave = pe.Var(initialize=0, bounds=(-ub, ub))
 
+        # Elementary flows are mutable, so that scenarios can be changed without rebuilding the lp
+        row_scale, col_scale = self.scales()
+        self.lp.b = pe.Param(self.lp.s_set, mutable=True,
+                             initialize=dict(zip(self.processes, np.array(self.b, dtype=float) * col_scale)))
+        self.lp.b.construct()
+
+        for process_name in self.deactivated | self.pruned:
+            self.lp.s[process_name].fix(0)
+        for process_name in self.process_caps.keys():
+            self.lp.s[process_name].setub(self.process_caps[process_name] / col_scale[self.processes.index(process_name)])
+
+    @profiler.profile('lci.construct_demand_constraints')
     def construct_demand_constraints(self):
 
         self.lp.define_y = pe.ConstraintList()
@@ -200,39 +343,287 @@ class LifeCycleInventory:
         self.lp.capacity_constraints2 = pe.ConstraintList()
         self.lp.capacity_constraints2.construct()
 
+        s_vars = [self.lp.s[j] for j in self.processes]
+        A = self.scaled_matrix()
+        row_scale, col_scale = self.scales()
+
         u = 0
         while u < len(self.intermediate_flows):
 
-            A_row = df_to_list(self.A.iloc[u:u + 1, :])
-
-            connect = 0
+            if self.active_flows is not None and not self.active_flows[u]:
+                self.lp.y[self.intermediate_flows[u]].fix(0)  # Removed by presolve, no flow possible
+                u += 1
+                continue
+
+            # Nonzero entries of row u of the technology matrix (CSR)
+            row = slice(A.indptr[u], A.indptr[u + 1])
+            cols = A.indices[row]
+            coefs = A.data[row]
+            if self.active_processes is not None:
+                keep = self.active_processes[cols]
+                cols = cols[keep]
+                coefs = coefs[keep]
+            positive = coefs > 0
+
+            connect_coefs, connect_vars, connect_const = [], [], 0
             if self.intermediate_flows[u] in self.connector.keys():
                 connect = self.connector[self.intermediate_flows[u]]
+                if isinstance(connect, (int, float)):
+                    connect_const = row_scale[u] * connect
+                else:
+                    connect_coefs, connect_vars = [row_scale[u]], [connect]
+
+            y_u = self.lp.y[self.intermediate_flows[u]]
 
-            self.lp.define_y.add(
-                expr=weighted_sum(A_row, self.lp.s, self.processes) + connect - self.lp.y[self.intermediate_flows[u]] == 0)
+            self.lp.define_y.add(expr=LinearExpression(
+                constant=connect_const,
+                linear_coefs=coefs.tolist() + connect_coefs + [-1],
+                linear_vars=[s_vars[j] for j in cols.tolist()] + connect_vars + [y_u]) == 0)
 
             if self.p[u] > 0:
                 'Set capacity constraints for chemical products. No connectors needed, as no chemical with specified prod. cap. is connected'
-                self.lp.capacity_constraints1.add(
-                    expr=weighted_sum_positive(A_row, self.lp.s, self.processes) + connect - self.p[u] / self.scale >= 0)
+                self.lp.capacity_constraints1.add(expr=LinearExpression(
+                    constant=connect_const - row_scale[u] * self.p[u] / self.scale,
+                    linear_coefs=coefs[positive].tolist() + connect_coefs,
+                    linear_vars=[s_vars[j] for j in cols[positive].tolist()] + connect_vars) >= 0)
 
-                self.lp.capacity_constraints2.add(
-                    expr=self.lp.y[self.intermediate_flows[u]] >= 0)
+                self.lp.capacity_constraints2.add(expr=y_u >= 0)
 
             else:
-                self.lp.demand_constraints.add(expr=self.lp.y[self.intermediate_flows[u]] == 0)
+                self.lp.demand_constraints.add(expr=y_u == 0)
 
             u += 1
 
+    @profiler.profile('lci.presolve')
+    def presolve(self):
+        """
+        Removes processes and intermediate flows, which cannot carry flow in the current scenario.
+        Starting from the deactivated processes, two rules are applied until nothing changes
+        (all y >= 0, demand rows y = 0):
+            - a flow without active producer and connector cannot be consumed
+            - a demand flow without active consumer and connector cannot be produced
+        Removed processes are fixed to zero, removed flows are dropped from the constraints.
+        Must be called after the scenario is activated and before construct_demand_constraints.
+        activate_process, set_process_cap and reset_scenario revert the presolve (see undo_presolve).
+        Returns the number of removed processes and flows
+        """
+        A = sparse.csr_matrix(self.A)
+        m, n = A.shape
+        producers = (A > 0).astype(int)
+        consumers = (A < 0).astype(int)
+
+        connected = np.array([f in self.connector.keys() for f in self.intermediate_flows])
+        capacity = np.array(self.p, dtype=float) > 0
+
+        active = np.ones(n, dtype=bool)
+        for process_name in self.deactivated:
+            active[self.processes.index(process_name)] = False
+        for process_name in self.process_caps.keys():
+            if self.process_caps[process_name] <= 0:
+                active[self.processes.index(process_name)] = False
+
+        while True:
+            n_prod = producers.dot(active.astype(int))
+            n_cons = consumers.dot(active.astype(int))
+            unsupplied = (n_prod == 0) & ~connected
+            undisposable = (n_cons == 0) & ~connected & ~capacity
+            blocked = (consumers.T.dot(unsupplied.astype(int)) > 0) | (producers.T.dot(undisposable.astype(int)) > 0)
+            if not (blocked & active).any():
+                break
+            active &= ~blocked
+
+        used = (producers + consumers).dot(active.astype(int)) > 0
+        self.active_processes = active
+        self.active_flows = used | connected | capacity
+
+        self.pruned = set()
+        for j in np.flatnonzero(~active):
+            if self.processes[j] not in self.deactivated:
+                self.pruned.add(self.processes[j])
+        if self.lp is not None:
+            for process_name in self.pruned:
+                self.lp.s[process_name].fix(0)
+
+        return int((~active).sum()), int((~self.active_flows).sum())
+
+    @profiler.profile('lci.set_scaling')
+    def set_scaling(self, entries=None, outer=None, apply=True):
+        """
+        Writes scaling factors of the LP variables and constraints to the suffix lp.scaling_factor,
+        used by ipopt with nlp_scaling_method=user-scaling (see utils.scaling)
+            entries:    (optional) Jacobian entries, e.g. of the combined model, default: of the LP block
+            outer:      (optional) scaling factors of the connectors, if they are scaled by a superstructure
+            apply:      False only computes the factors (e.g. the superstructure checks the whole model)
+        The factors are not applied if they make the Jacobian of the LP block worse (see no_worse).
+        Returns the Jacobian statistics of the LP block before and after scaling, the factors and 'applied'
+        """
+        if entries is None:
+            entries = jacobian(self.lp)
+        entries = [e for e in entries if e[0].parent_block() is self.lp]
+        factors = scaling_factors(self.lp, entries, outer=outer)
+        combined = ComponentMap(factors)
+        if outer is not None:
+            combined.update(outer)
+        before = jacobian_statistics(entries)
+        after = jacobian_statistics(entries, combined)
+        applied = apply and no_worse(before, after)
+        if applied:
+            apply_scaling(self.lp, factors)
+        return {'before': before, 'after': after, 'factors': factors, 'applied': applied}
+
+    def connector_values(self):
+        """ Returns the numeric values of all connectors (numbers or fixed pyomo variables) """
+        values = {}
+        for flow in self.connector.keys():
+            c = self.connector[flow]
+            if isinstance(c, (int, float)):
+                values[flow] = c
+            elif c.fixed:
+                values[flow] = pe.value(c)
+            else:
+                raise ValueError('Connector ' + flow + ' must be numeric or fixed to be used in matrix form')
+        return values
+
+    @profiler.profile('lci.matrix_form')
+    def matrix_form(self):
+        """
+        Returns the TCM as arrays for scipy.optimize.linprog, with y = A s + connectors eliminated:
+            min (b + A^T v)^T s + v^T connectors
+            s.t. A_eq s = b_eq (demand constraints), A_ub s <= b_ub (capacity constraints)
+        After presolve, only the active rows and columns are returned, 'columns' maps them back to processes.
+        If A is equilibrated, the arrays are scaled as the lp and 'col_scale' maps the solution back to s
+        """
+        m, n = self.A.shape
+        A = self.scaled_matrix()
+        row_scale, col_scale = self.scales()
+        p = np.array(self.p, dtype=float) * row_scale
+        v = np.array(self.v, dtype=float) / row_scale
+
+        connect = np.zeros(m)
+        values = self.connector_values()
+        u = 0
+        while u < m:
+            if self.intermediate_flows[u] in values.keys():
+                connect[u] = values[self.intermediate_flows[u]] * row_scale[u]
+            u += 1
+
+        ub = 10 ** 18 / self.scale
+        bounds = np.zeros((n, 2))
+        bounds[:, 1] = ub
+        for process_name in self.process_caps.keys():
+            j = self.processes.index(process_name)
+            bounds[j, 1] = self.process_caps[process_name] / col_scale[j]
+        for process_name in self.deactivated:
+            bounds[self.processes.index(process_name), 1] = 0
+
+        c = np.array(self.b, dtype=float) * col_scale + A.T.dot(v)
+        constant = v.dot(connect)
+
+        rows = np.arange(m)
+        columns = np.arange(n)
+        if self.active_processes is not None:  # Presolve
+            rows = np.flatnonzero(self.active_flows)
+            columns = np.flatnonzero(self.active_processes)
+
+        A = A[rows][:, columns]
+        p = p[rows]
+        connect = connect[rows]
+
+        capacity = p > 0  # nan entries count as demand constraints, as in construct_demand_constraints
+        demand = ~capacity
+
+        A_eq = A[np.flatnonzero(demand)]
+        b_eq = -connect[demand]
+
+        # Capacity constraints: A_pos s + c >= p / scale and y = A s + c >= 0
+        A_cap = A[np.flatnonzero(capacity)]
+        A_ub = sparse.vstack([-A_cap.multiply(A_cap > 0), -A_cap]).tocsr()
+        b_ub = np.concatenate([connect[capacity] - p[capacity] / self.scale, connect[capacity]])
+
+        return {'c': c[columns], 'constant': constant, 'A_eq': A_eq, 'b_eq': b_eq, 'A_ub': A_ub, 'b_ub': b_ub,
+                'bounds': bounds[columns], 'columns': columns, 'col_scale': col_scale[columns]}
+
+    def check_bounds(self):
+        """ Raises a Warning, if tightened bounds would become invalid by a change of processes or caps """
+        if self.tightened:
+            raise Warning('Variable bounds were tightened for the current processes, call Solver.restore_bounds first')
+
     def deactivate_process(self, process_name):
-        try:
-            type(self.lp.deactivated_processes)
-        except AttributeError:
-            self.lp.deactivated_processes = pe.ConstraintList()
-            self.lp.deactivated_processes.construct()
+        """ Switches a process off by fixing its scaling factor to zero """
+        self.deactivated.add(process_name)
+        if self.lp is not None:
+            self.lp.s[process_name].fix(0)
+            self.changed_processes.add(process_name)
 
-        self.lp.deactivated_processes.add(expr=self.lp.s[process_name] == 0)
+    def undo_presolve(self):
+        """
+        Reverts presolve, which is only valid for the scenario it was computed for: the pruned processes are
+        freed and the demand constraints, if already built, are rebuilt with all processes and flows.
+        presolve can be called again for the new scenario
+        """
+        if self.active_processes is None:
+            return
+        pruned = self.pruned
+        self.active_processes = None
+        self.active_flows = None
+        self.pruned = set()
+        if self.lp is None:
+            return
+        for process_name in pruned:
+            self.lp.s[process_name].unfix()
+            self.changed_processes.add(process_name)
+        if self.lp.component('define_y') is not None:
+            for name in ('define_y', 'demand_constraints', 'capacity_constraints1', 'capacity_constraints2'):
+                self.lp.del_component(name)
+                self.lp.del_component(name + '_index')  # Implicit index set of the ConstraintList
+            for flow in self.intermediate_flows:
+                self.lp.y[flow].unfix()
+            self.construct_demand_constraints()
+            self.changed_constraints = True
+
+    def activate_process(self, process_name):
+        """ Reverts deactivate_process (and a presolve) """
+        self.check_bounds()
+        self.undo_presolve()
+        self.deactivated.discard(process_name)
+        if self.lp is not None:
+            self.lp.s[process_name].unfix()
+            self.changed_processes.add(process_name)
+
+    def set_process_cap(self, process_name, cap):
+        """
+        Sets an upper bound on the (scaled) scaling factor of a process, reverts a presolve
+        cap: upper bound, None removes the cap
+        """
+        self.check_bounds()
+        self.undo_presolve()
+        if cap is None:
+            self.process_caps.pop(process_name, None)
+        else:
+            self.process_caps[process_name] = cap
+        if self.lp is not None:
+            if cap is None:
+                self.lp.s[process_name].setub(10 ** 18 / self.scale)
+            else:
+                self.lp.s[process_name].setub(cap / self.scales()[1][self.processes.index(process_name)])
+            self.changed_processes.add(process_name)
+
+    def set_impact(self, process_name, value):
+        """ Changes the elementary flow (impact) of a process in place """
+        j = self.processes.index(process_name)
+        self.b[j] = value
+        if self.lp is not None:
+            self.lp.b[process_name] = value * self.scales()[1][j]
+            self.changed_impacts = True
+
+    def reset_scenario(self):
+        """ Re-activates all processes, removes all process caps and reverts a presolve """
+        self.check_bounds()
+        self.undo_presolve()
+        for process_name in list(self.deactivated):
+            self.activate_process(process_name)
+        for process_name in list(self.process_caps.keys()):
+            self.set_process_cap(process_name, None)
 
     def activate_scenario(self, name, e=0):
         """
@@ -248,7 +639,7 @@ class LifeCycleInventory:
             self.deactivate_process('EU-28: Electricity from wind power ts')
 
 
-            self.b[self.processes.index('Electricity, user-defined')] = e
+            self.set_impact('Electricity, user-defined', e)
         elif name == 'Electricity Best Case':
             self.deactivate_process('EU-28: Electricity from grid mix (2020)')
             self.deactivate_process('Electricity, user-defined')
@@ -287,10 +678,17 @@ class LifeCycleInventory:
             raise Warning('Unknown scenario for LCI')
         return
 
+    @profiler.profile('lci.construct_objective')
     def construct_objective(self):
 
-        self.lp.define_cradle2gate = pe.Constraint(expr=self.lp.obj_cradle2gate == weighted_sum(self.b, self.lp.s, self.processes))
-        self.lp.define_gate2grave = pe.Constraint(expr=self.lp.obj_gate2grave == weighted_sum(self.v, self.lp.y, self.intermediate_flows))
+        # Impacts enter the objective directly (no defining row), so that set_impact only changes objective
+        # coefficients, which a persistent solver updates with set_objective (see Solver.solve_lp_persistent)
+        self.lp.obj_cradle2gate = pe.Expression(expr=LinearExpression(
+            constant=0,
+            linear_coefs=[self.lp.b[j] for j in self.processes],
+            linear_vars=[self.lp.s[j] for j in self.processes]))
+        v = (np.array(self.v, dtype=float) / self.scales()[0]).tolist()
+        self.lp.define_gate2grave = pe.Constraint(expr=self.lp.obj_gate2grave == weighted_sum(v, self.lp.y, self.intermediate_flows))
 
         self.lp.objective = pe.Objective(expr=self.lp.obj_cradle2gate + self.lp.obj_gate2grave, sense=pe.minimize)
 
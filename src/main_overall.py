@@ -5,6 +5,9 @@ from utils.properties import molar_weight
 from utils.utils import sum_rule
 from utils.save_results import ResultManager
 from utils.solve_model import Solver
+from utils.profiling import profiler
+
+# profiler.enable()  # Records wall time and peak memory of build and solve phases
 
 """ Separation System / Flowsheet construction """
 
@@ -31,11 +34,11 @@ s.create_disjunct_reactor('methane_reforming', 'por', 'R2_POR', 39, 40, 'POR')
 s.create_disjunct_reactor('methane_reforming', 'cdr', 'R2_CDR', 39, 40, 'CDR')
 
 s.model.cdr.y_37 = pe.Constraint(expr=s.model.y[37, 'CO2'] == 1)
-s.model.cdr.add = pe.Constraint(expr=s.model.n[37] == 1 * s.model.n[36] * s.model.y[36, 'CH4'])
+s.model.cdr.add = pe.Constraint(expr=s.model.n[37] == 1 * s.model.n[36] * s.streams[36].y['CH4'])
 s.model.cdr.q_constr = pe.Constraint(expr=s.model.q['R2_POR'] == 0)
 
 s.model.por.y_37 = pe.Constraint(expr=s.model.y[37, 'O2'] == 1)
-s.model.por.add = pe.Constraint(expr=s.model.n[37] == 0.48 * s.model.n[36] * s.model.y[36, 'CH4'])
+s.model.por.add = pe.Constraint(expr=s.model.n[37] == 0.48 * s.model.n[36] * s.streams[36].y['CH4'])
 s.model.por.q_constr = pe.Constraint(expr=s.model.q['R2_CDR'] == 0)
 
 # B(O)FG Separation
@@ -110,7 +113,7 @@ s.model.heat_balance = pe.Constraint(expr=0 == - s.model.connect_lp['Heat [MJ]']
 s.model.co2_atm_balance = pe.Constraint(expr=0 == s.model.connect_lp['CO2 to atm [kg]'] - s.model.n[12] * molar_weight('CO2') * (s.model.y[12, 'CO2'] + s.model.y[12, 'CO']))
 s.model.steam_balance = pe.Constraint(expr=0 == s.model.connect_lp['STEAM [kg]'] + s.model.n[22] * molar_weight('H2O'))
 s.model.co_balance = pe.Constraint(expr=0 == s.model.connect_lp['Carbon monoxide (CO) [kg]'] - s.model.n[20] * molar_weight('CO'))
-s.model.ch4_balance = pe.Constraint(expr=s.model.connect_lp['Methane (CH4) [kg]'] == s.model.n[35] * s.model.y[35, 'CH4'] * molar_weight('CH4'))
+s.model.ch4_balance = pe.Constraint(expr=s.model.connect_lp['Methane (CH4) [kg]'] == s.model.n[35] * s.streams[35].y['CH4'] * molar_weight('CH4'))
 s.model.h2_balance = pe.Constraint(expr=s.model.connect_lp['Hydrogen (H2) [kg]'] == s.model.n[33] * molar_weight('H2') + s.model.n[11] * molar_weight('H2'))
 
 # s.model.cdr.syngas11_balance = pe.Constraint(expr=s.model.connect_lp['SYNTHESIS GAS (1:1)'] == s.model.n[40] * molar_weight({'H2': 0.5, 'CO': 0.5}))  # N2 wird als SynGas angenommen
@@ -131,6 +134,7 @@ s.model.cdr.o2_balance = pe.Constraint(expr=s.model.connect_lp['Oxygen (O2) [kg]
 lci = LifeCycleInventory('millgas2what')
 
 lci.import_from_excel('Life Cycle Inventory_v21_Matthias.xlsx', 'A-Matrix', 'End of life')
+# print(lci.equilibrate())  # Row and column equilibration of A, for inventories with badly scaled entries
 lci.set_up_lp(scale)
 lci.import_connector(connector_lp)  # Durch deaktivieren dieser Zeile wird nur die Chem. Ind. betrachtet
 
@@ -143,12 +147,14 @@ lci.activate_scenario('Separation GDP')  # Schaltet alle linearen Prozesse für
 lci.activate_scenario('CCU high TRL only')
 lci.deactivate_process('CARBON DIOXIDE - ammonia plant')
 lci.deactivate_process('Water gas shift reaction')
-lci.lp.ammonia_constraint = pe.Constraint(expr=lci.lp.s['AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture'] - 220 <= 0) #120 #228.9 120
+lci.set_process_cap('AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture', 220)  #120 #228.9 120
 #lci.deactivate_process('CARBON DIOXIDE - air capture')
 lci.deactivate_process('TDI - neue Route_v2 exklusive Methylformate production')
 lci.deactivate_process('Polycarbonate - neue Route')
 lci.deactivate_process('Methylformate productionaus TDI neue Route v2')
 
+lci.presolve()  # Removes processes and flows, which cannot carry flow in this scenario
+
 lci.construct_demand_constraints()
 lci.construct_objective()
 
@@ -159,7 +165,8 @@ s.create_disjunctions()
 """ Solve overall model """
 
 solver = Solver()
-solver.solve_gdp(s)
+print(solver.solve_gdp(s, initialize=True))
+# record = solver.solve_enumerate(s)  # Alternative to LOA: solves all disjunct configurations in parallel, see record.ranking
 # solver.test_feasibility()
 
 """ Display results"""
@@ -167,4 +174,5 @@ solver.solve_gdp(s)
 # print(pe.value(s.model.utilization.s['INC Carbon monoxide']))
 results = ResultManager(s)
 
-
+if profiler.enabled:
+    print(profiler.to_table())
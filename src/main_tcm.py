@@ -2,6 +2,9 @@ import pyomo.environ as pe
 from lci import LifeCycleInventory
 from utils.save_results import ResultManager
 from utils.solve_model import Solver
+from utils.profiling import profiler
+
+# profiler.enable()  # Records wall time and peak memory of build and solve phases
 
 lci = LifeCycleInventory('millgas2what')
 
@@ -37,6 +40,7 @@ lci.model.heat_balance = pe.Constraint(expr=0 == - lci.model.heat_steelMill + lc
 'Ab hier wird das Modell mit der LCI-Klasse zusammengebaut'
 
 lci.import_from_excel('Life Cycle Inventory_v19.xlsx', 'A-Matrix', 'End of life')
+# print(lci.equilibrate())  # Row and column equilibration of A, for inventories with badly scaled entries
 lci.set_up_lp(scale)
 lci.import_connector(connector_lp)  # Durch deaktivieren dieser Zeile wird nur die Chem. Ind. betrachtet
 
@@ -50,11 +54,13 @@ lci.activate_scenario('CCU high TRL only')
 # lci.activate_scenario('No high TRL CCU')  # Durch aktivieren dieser Zeile werden die high TRL CCU-Prozesse deaktiviert und das konevntionelle Szenario erzeugt
 lci.deactivate_process('CARBON DIOXIDE - ammonia plant')
 lci.deactivate_process('Water gas shift reaction')
-lci.lp.ammonia_constraint = pe.Constraint(expr=lci.lp.s['AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture'] - 228.9 <= 0)
+lci.set_process_cap('AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture', 228.9)
 lci.deactivate_process('TDI - neue Route_v2 exklusive Methylformate production')
 lci.deactivate_process('Polycarbonate - neue Route')
 lci.deactivate_process('Methylformate productionaus TDI neue Route v2')
 
+lci.presolve()  # Removes processes and flows, which cannot carry flow in this scenario
+
 lci.construct_demand_constraints()
 lci.construct_objective()
 
@@ -65,7 +71,10 @@ lci.model.add_component('lp', lci.lp)
 # lci.model.pprint()
 
 solver = Solver()
-solver.solve_lp(lci, 'glpk')
+print(solver.solve_lp(lci, 'glpk'))
 # solver.test_feasibility() # Muss an neue Demand-Constraints angepasst werden
 
 results = ResultManager(lci)
+
+if profiler.enabled:
+    print(profiler.to_table())
@@ -10,6 +10,11 @@ def load_object(filename):
     return object
 
 
+def solved(point):
+    """ True if the point was solved successfully (older results marked solver crashes with z=0) """
+    return point.get('ok', point['z'] != 0)
+
+
 def plot_results_bfg(plot_name, results, options):
 
     x_data = []
@@ -24,7 +29,7 @@ def plot_results_bfg(plot_name, results, options):
 
     for k in results['gdp'].keys():
         if k != 'options':
-            if results['gdp'][k]['z'] != 0:  # Abstürze des Solvers wurden mit z=0 markiert
+            if solved(results['gdp'][k]):
                 x_data.append(results['gdp'][k]['x']*3600)
                 y_bfg_data.append(results['gdp'][k]['c']['Mill gas BFG/BOFG [kg]']/1E+12)
                 y_h2_data.append(results['gdp'][k]['bfg']['H2']/1E+12)
@@ -136,7 +141,7 @@ def plot_results_cog(plot_name, results, options):
 
     for k in results['gdp'].keys():
         if k != 'options':
-            if results['gdp'][k]['z'] != 0:
+            if solved(results['gdp'][k]):
                 if results['gdp'][k]['c']['SYNTHESIS GAS (2:1)'] <= 1E+9:
                     x_data.append(results['gdp'][k]['x']*3600)
                     y_cog_data.append(results['gdp'][k]['c']['Mill gas COG [kg]']/1E+9)
@@ -261,7 +266,7 @@ def plot_results(plot_name, results, options):
 
     for k in results['gdp'].keys():
         if k != 'options':
-            if results['gdp'][k]['z'] != 0:
+            if solved(results['gdp'][k]) and solved(results['tcm'][k]):
                 x_data.append(results['gdp'][k]['x']*3600)
                 y1_data.append(results['gdp'][k]['z']/1E+12)
                 y2_data.append(results['tcm'][k]['z']/1E+12)
@@ -336,7 +341,7 @@ def plot_results_co2(plot_name, results, options):
 
     for k in results['gdp'].keys():
         if k != 'options':
-            if results['gdp'][k]['z'] != 0:
+            if solved(results['gdp'][k]):
                 x_data.append(results['gdp'][k]['x']*3600)
 
                 s_ammonia_co2_data.append((results['gdp'][k]['s']['AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture'] * 1.2)/1E+12)
@@ -409,6 +414,110 @@ def plot_results_co2(plot_name, results, options):
     fig.savefig(plot_name, transparent=True)
 
 
+def plot_results_tcm(plot_name, results, options):
+    """
+    Plots the TCM curve through the points of results['tcm']. If the sweep stored the exact breakpoints of
+    Solver.solve_parametric as results['tcm_curve'], the line connects these instead
+    """
+
+    x_data = []
+    y_data = []
+
+    for k in sorted(results['tcm'].keys()):
+        if solved(results['tcm'][k]):
+            x_data.append(results['tcm'][k]['x']*3600)
+            y_data.append(results['tcm'][k]['z']/1E+12)
+
+    x_line = x_data
+    y_line = y_data
+    if 'tcm_curve' in results.keys():
+        x_line = [results['tcm_curve'][k]['x']*3600 for k in sorted(results['tcm_curve'].keys())]
+        y_line = [results['tcm_curve'][k]['z']/1E+12 for k in sorted(results['tcm_curve'].keys())]
+
+    fig = plt.figure(
+        figsize=options['size'],
+        dpi=options['dpi'])  # Bei zu hoher Auflösung (dpi) wird das Diagramm nicht mehr angezeigt
+    ax = fig.add_subplot(111, autoscale_on=False)
+
+    ax.plot(x_line, y_line, color='tab:blue', label='Opt. Chem.', linewidth=1.5)
+    ax.plot(x_data, y_data, color='tab:blue', marker='o', markersize=2, linestyle='none')
+
+    if options['vlines']:
+        ax.axvline(0.00957*1000, color='xkcd:grey', linestyle='--', linewidth=0.5)
+        ax.axvline(0.386*1000, color='xkcd:grey', linestyle='--', linewidth=0.5)
+
+    ax.set_xlim([0, max(x_line)])
+    ax.set_ylim([0, 6])
+
+    if options['legend']:
+        ax.legend(loc='lower right', frameon=False)
+
+    if options['labels']:
+        if options['language'] == 'eng':
+            ax.set_xlabel(r'Carbon Footprint of electricity in g $CO_2$-eq / kWh')
+            ax.set_ylabel(r'Cradle-to-grave GHG emissions in Gt $CO_2$-eq / year')
+        if options['language'] == 'de':
+            ax.set_xlabel(r'GHG-Emissionen Strom in g $CO_2$-eq / kWh')
+            ax.set_ylabel(r'GHG-Emissionen Chemieindustrie (Cradle-to-grave) in Gt $CO_2$-eq / Jahr')
+
+    # display the plot
+    plt.show()
+
+    fig.savefig(plot_name, transparent=True)
+
+
+
+def plot_convergence(plot_name, trace, options):
+    """
+    Plots the bounds of a GDPopt run over its NLP subproblems and the time spent in NLP and MIP solves,
+    e.g. trace = results['gdp'][k]['solve']['trace'] (see GdpTrace in utils/solve_model.py)
+    """
+
+    n_data = []
+    lb_data = []
+    ub_data = []
+    nlp_time_data = []
+    mip_time_data = []
+    infeasible_data = []
+
+    for n, entry in enumerate(trace):
+        n_data.append(n + 1)
+        lb_data.append(entry['LB'] if abs(entry['LB']) != float('inf') else np.nan)
+        ub_data.append(entry['UB'] if abs(entry['UB']) != float('inf') else np.nan)
+        nlp_time_data.append(entry['nlp_time'] or 0)
+        mip_time_data.append(entry['mip_time'] or 0)
+        if entry['nlp_status'] == 'infeasible':
+            infeasible_data.append(n + 1)
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True, figsize=options['size'], dpi=options['dpi'])
+
+    ax1.step(n_data, ub_data, where='post', color='tab:blue', label='UB', linewidth=1.5)
+    ax1.step(n_data, lb_data, where='post', color='tab:orange', label='LB', linewidth=1.5)
+    for n in infeasible_data:
+        ax1.axvline(n, color='xkcd:grey', linestyle='--', linewidth=0.5)
+
+    ax2.bar(n_data, nlp_time_data, color='tab:blue', label='NLP')
+    ax2.bar(n_data, mip_time_data, bottom=nlp_time_data, color='tab:orange', label='MIP')
+
+    if options['legend']:
+        ax1.legend(loc='upper right', frameon=False)
+        ax2.legend(loc='upper right', frameon=False)
+
+    if options['labels']:
+        if options['language'] == 'eng':
+            ax1.set_ylabel('Objective bounds')
+            ax2.set_xlabel('Subproblem')
+            ax2.set_ylabel('Solver time in s')
+        if options['language'] == 'de':
+            ax1.set_ylabel('Schranken der Zielfunktion')
+            ax2.set_xlabel('Teilproblem')
+            ax2.set_ylabel('Rechenzeit in s')
+
+    # display the plot
+    plt.show()
+
+    fig.savefig(plot_name, transparent=True)
+
 name = '20200816_v19_pcest7_100_complete'
 results = load_object(name)
 options = {'size': [11/2.54, 10/2.54], 'dpi': 1000, 'labels': False, 'legend': True, 'vlines': True, 'language': 'de'}
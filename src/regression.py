@@ -0,0 +1,218 @@
+import json
+import os
+import sys
+import pyomo.environ as pe
+from lci import LifeCycleInventory
+from utils.solve_model import Solver
+from utils.synthetic import synthetic_inventory, write_inventory_excel, synthetic_superstructure, \
+    import_synthetic_lci, connector_flows
+
+"""
+Regression harness: solves a fixed set of reference scenarios and compares objective and selected disjuncts
+with the golden values in golden.json (committed), and solve time and iteration counts with the baseline in
+baseline.json (machine-specific, not committed, timing is only checked if it exists).
+    python regression.py                check against golden.json and baseline.json (exit code 1 on failure)
+    python regression.py --record       (re-)record golden values and baseline, e.g. after an intended model change
+    python regression.py --baseline     only update the timing baseline, e.g. after an intended speedup
+"""
+
+regression_dir = 'regression'
+golden_file = os.path.join(regression_dir, 'golden.json')
+baseline_file = os.path.join(regression_dir, 'baseline.json')
+inventory_file = 'Life Cycle Inventory_v19.xlsx'  # Licensed inventory, scenarios are skipped if it is missing
+
+scale = 1000000000
+objective_tol = 1E-6  # Relative tolerance of the objective
+time_tol = 1.5  # Solve time may grow by this factor before a slowdown is reported
+time_floor = 1.0  # [s] Slowdowns of faster solves are not reported (timer noise)
+iterations_tol = 1.2  # Iteration counts may grow by this factor
+
+
+def synthetic_file(flows, processes, density, seed):
+    """ Writes the synthetic inventory of a scenario once and returns its file name """
+    filename = os.path.join(regression_dir, 'synthetic_{}_{}_{}.xlsx'.format(flows, processes, seed))
+    if not os.path.isfile(filename):
+        write_inventory_excel(filename, synthetic_inventory(flows, processes, density=density,
+                                                            connectors=connector_flows, seed=seed))
+    return filename
+
+
+def tcm_synthetic(solver_name):
+    """ TCM of a synthetic inventory with 200 flows, solved with solver_name ('glpk' or 'matrix') """
+    lci = LifeCycleInventory('regression')
+    lci.import_from_excel(synthetic_file(200, 500, 0.02, 1), 'A-Matrix', 'End of life')
+    solver = Solver()
+    if solver_name == 'matrix':
+        lci.scale = scale
+        sol = solver.solve_matrix(lci)
+        return {'objective': sol['objective'] * scale, 'disjuncts': [], 'ok': True,
+                'wall_time': lci.solver_timer, 'iterations': {'highs': sol['iterations']}}
+
+    lci.model = pe.ConcreteModel('regression')
+    lci.set_up_lp(scale)
+    lci.construct_demand_constraints()
+    lci.construct_objective()
+    lci.model.add_component('lp', lci.lp)
+    record = solver.solve_lp(lci, solver_name)
+    return outcome(record, [], lci.scale)
+
+
+def gdp_synthetic():
+    """
+    Combined model of a synthetic inventory with 100 flows and one flowsheet train. With more (identical)
+    trains only one is used at the optimum and the selected disjuncts of the others are not unique
+    """
+    s = synthetic_superstructure(1, scale)
+    lci = LifeCycleInventory('regression')
+    lci.import_from_excel(synthetic_file(100, 250, 0.03, 2), 'A-Matrix', 'End of life')
+    lci.set_up_lp(scale)
+    import_synthetic_lci(s, lci)
+    record = Solver().solve_gdp(s)
+    return outcome(record, selected_disjuncts(s), scale)
+
+
+def tcm_inventory():
+    """ TCM of the licensed inventory as in repeated_solving_el_impact (grid mix 2020) """
+    from repeated_solving_el_impact import build_tcm
+    lci = build_tcm(0.1072 / 1000)
+    record = Solver().solve_lp(lci, 'glpk')
+    return outcome(record, [], lci.scale)
+
+
+def gdp_inventory():
+    """ Combined model of the licensed inventory as in repeated_solving_el_impact (grid mix 2020) """
+    from repeated_solving_el_impact import build_gdp
+    s = build_gdp(0.1072 / 1000)
+    record = Solver().solve_gdp(s)
+    return outcome(record, selected_disjuncts(s), s.lci.scale)
+
+
+def selected_disjuncts(s):
+    return sorted(d for d in s.disjuncts.keys() if pe.value(s.disjuncts[d].indicator_var) > 0.5)
+
+
+def outcome(record, disjuncts, scale):
+    return {'objective': record.incumbent * scale if record.incumbent is not None else None,
+            'disjuncts': disjuncts, 'ok': record.ok, 'wall_time': record.wall_time,
+            'iterations': dict(record.iterations)}
+
+
+# Reference scenarios: name: (function, required file)
+scenarios = {'tcm_synthetic_glpk': (lambda: tcm_synthetic('glpk'), None),
+             'tcm_synthetic_matrix': (lambda: tcm_synthetic('matrix'), None),
+             'gdp_synthetic': (gdp_synthetic, None),
+             'tcm_inventory': (tcm_inventory, inventory_file),
+             'gdp_inventory': (gdp_inventory, inventory_file)}
+
+# Scenarios without committed golden values, skipped by check: golden values must be recorded by this harness
+# (--record) on a machine with glpk and ipopt. Remove a scenario here once its golden values are committed
+unrecorded = ['tcm_synthetic_glpk', 'gdp_synthetic']
+
+
+def check(name, result, golden, baseline=None):
+    """
+    Returns the failures of one scenario as list of messages (empty if it passed).
+    Timing and iterations are only checked against a baseline of this machine
+    """
+    failures = []
+    if not result['ok']:
+        failures.append('solve failed')
+    if result['objective'] is None or golden['objective'] is None:
+        if result['objective'] != golden['objective']:
+            failures.append('objective {} instead of {}'.format(result['objective'], golden['objective']))
+    elif abs(result['objective'] - golden['objective']) > objective_tol * max(1, abs(golden['objective'])):
+        failures.append('objective {:.10g} instead of {:.10g}'.format(result['objective'], golden['objective']))
+    if result['disjuncts'] != golden['disjuncts']:
+        failures.append('disjuncts {} instead of {}'.format(result['disjuncts'], golden['disjuncts']))
+    if baseline is None:
+        return failures
+    if result['wall_time'] > max(time_tol * baseline['wall_time'], time_floor):
+        failures.append('slowdown: {:.2f} s instead of {:.2f} s'.format(result['wall_time'], baseline['wall_time']))
+    for k in baseline['iterations'].keys():
+        if k in result['iterations'].keys() and result['iterations'][k] > iterations_tol * baseline['iterations'][k]:
+            failures.append('{} iterations: {} instead of {}'.format(k, result['iterations'][k],
+                                                                     baseline['iterations'][k]))
+    return failures
+
+
+def load(filename):
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as input:
+        return json.load(input)
+
+
+def dump(data, filename):
+    with open(filename, 'w') as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+
+
+def run(mode='check'):
+    """
+    mode: 'check', 'record' (golden values and baseline) or 'baseline' (timing only)
+    Returns True if all scenarios passed
+    """
+    if not os.path.isdir(regression_dir):
+        os.makedirs(regression_dir)
+    golden = load(golden_file)
+    baseline = load(baseline_file)
+
+    passed = True
+    for name in scenarios.keys():
+        function, required_file = scenarios[name]
+        if required_file is not None and not os.path.isfile(required_file):
+            print('{:<24} skipped ({} not found)'.format(name, required_file))
+            continue
+        if mode != 'record' and name in unrecorded and name not in golden.keys():
+            print('{:<24} skipped (golden values not recorded yet, run with --record)'.format(name))
+            continue
+
+        result = function()
+
+        if mode == 'record' and not result['ok']:
+            print('{:<24} FAILED, not recorded: solve failed'.format(name))
+            passed = False
+        elif mode == 'record':
+            golden[name] = {'objective': result['objective'], 'disjuncts': result['disjuncts']}
+            baseline[name] = {'wall_time': result['wall_time'], 'iterations': result['iterations']}
+            print('{:<24} recorded: z = {}, {:.2f} s'.format(name, result['objective'], result['wall_time']))
+        elif name not in golden.keys():
+            print('{:<24} no golden values, run with --record'.format(name))
+            passed = False
+        elif mode == 'baseline':
+            failures = check(name, result, golden[name])
+            if failures:
+                print('{:<24} FAILED, baseline not updated: {}'.format(name, '; '.join(failures)))
+                passed = False
+            else:
+                baseline[name] = {'wall_time': result['wall_time'], 'iterations': result['iterations']}
+                print('{:<24} baseline updated: {:.2f} s'.format(name, result['wall_time']))
+        else:
+            failures = check(name, result, golden[name], baseline.get(name))
+            if failures:
+                print('{:<24} FAILED: {}'.format(name, '; '.join(failures)))
+                passed = False
+            elif name in baseline.keys():
+                print('{:<24} passed ({:.2f} s, baseline {:.2f} s)'.format(name, result['wall_time'],
+                                                                           baseline[name]['wall_time']))
+            else:
+                print('{:<24} passed ({:.2f} s, no baseline)'.format(name, result['wall_time']))
+
+    if mode == 'record':
+        dump(golden, golden_file)
+    if mode != 'check':
+        dump(baseline, baseline_file)
+    return passed
+
+
+if __name__ == '__main__':
+
+    if '--record' in sys.argv:
+        mode = 'record'
+    elif '--baseline' in sys.argv:
+        mode = 'baseline'
+    else:
+        mode = 'check'
+
+    if not run(mode):
+        sys.exit(1)
@@ -4,9 +4,14 @@ from superstructure import Superstructure
 from utils.properties import molar_weight
 from utils.utils import sum_rule
 from utils.save_results import ResultManager
-from utils.solve_model import Solver
+from utils.solve_model import Solver, store_solution
+from utils.sweep import run_sweep, file_hash
+from utils import properties
+from utils.profiling import profiler
 import time as time
 import pickle
+import glob
+import os
 
 
 def range_len(start, stop, len):
@@ -20,45 +25,61 @@ def range_len(start, stop, len):
     return list
 
 
-def rep_solve_tcm(x):
+def build_tcm(x, engine='pyomo'):
+    """
+    Builds the TCM once. The electricity impact x is a mutable parameter of the lp,
+    which is changed in place by rep_solve_tcm
+    engine: 'pyomo' (lp solved with glpk) or 'matrix' (arrays solved with HiGHS, no pyomo model)
+    """
     lci = LifeCycleInventory('millgas2what')
 
-    lci.model = pe.ConcreteModel('millgas2what')
-
     scale = 1000000000
 
-    'Ströme des Stahlwerks als Parameter'
+    lci.import_from_excel(inventory_file, 'A-Matrix', 'End of life')
 
-    lci.model.cog_steelMill = pe.Param(initialize=39700000000 / scale)  # in kg, scaled
-    lci.model.bfg_steelMill = pe.Param(initialize=1740550000000 / scale)  # in kg, scaled
-    lci.model.electricity_steelMill = pe.Param(initialize=-2298568545000 / scale)
-    lci.model.heat_steelMill = pe.Param(initialize=-894991475000 / scale)
+    if engine == 'matrix':
+        'Ströme des Stahlwerks als feste Verbindungspunkte'
 
-    'Definition der Verbindungspunkte'
+        lci.scale = scale
+        lci.import_connector({'Mill gas COG [kg]': 39700000000 / scale,
+                              'Mill gas BFG/BOFG [kg]': 1740550000000 / scale,
+                              'Electricity [MJ]': -2298568545000 / scale,
+                              'Heat [MJ]': -894991475000 / scale})
 
-    connect_list = ['Mill gas COG [kg]', 'Mill gas BFG/BOFG [kg]', 'Electricity [MJ]', 'Heat [MJ]']
+    else:
+        lci.model = pe.ConcreteModel('millgas2what')
 
-    connector_lp = {}
-    lci.model.connect_lp = pe.Var(connect_list, initialize=0, bounds=(-10000, 10000))
+        'Ströme des Stahlwerks als Parameter'
 
-    for c in connect_list:
-        connector_lp[c] = lci.model.connect_lp[c]
+        lci.model.cog_steelMill = pe.Param(initialize=39700000000 / scale)  # in kg, scaled
+        lci.model.bfg_steelMill = pe.Param(initialize=1740550000000 / scale)  # in kg, scaled
+        lci.model.electricity_steelMill = pe.Param(initialize=-2298568545000 / scale)
+        lci.model.heat_steelMill = pe.Param(initialize=-894991475000 / scale)
 
-    'Gesamtbilanzen'
+        'Definition der Verbindungspunkte'
 
-    lci.model.cog_balance = pe.Constraint(
-        expr=0 == - lci.model.cog_steelMill + lci.model.connect_lp['Mill gas COG [kg]'])
-    lci.model.bfg_balance = pe.Constraint(
-        expr=0 == - lci.model.bfg_steelMill + lci.model.connect_lp['Mill gas BFG/BOFG [kg]'])
-    lci.model.electricity_balance = pe.Constraint(
-        expr=0 == - lci.model.electricity_steelMill + lci.model.connect_lp['Electricity [MJ]'])
-    lci.model.heat_balance = pe.Constraint(expr=0 == - lci.model.heat_steelMill + lci.model.connect_lp['Heat [MJ]'])
+        connect_list = ['Mill gas COG [kg]', 'Mill gas BFG/BOFG [kg]', 'Electricity [MJ]', 'Heat [MJ]']
 
-    'Ab hier wird das Modell mit der LCI-Klasse zusammengebaut'
+        connector_lp = {}
+        lci.model.connect_lp = pe.Var(connect_list, initialize=0, bounds=(-10000, 10000))
 
-    lci.import_from_excel('Life Cycle Inventory_v19.xlsx', 'A-Matrix', 'End of life')
-    lci.set_up_lp(scale)
-    lci.import_connector(connector_lp)  # Durch deaktivieren dieser Zeile wird nur die Chem. Ind. betrachtet
+        for c in connect_list:
+            connector_lp[c] = lci.model.connect_lp[c]
+
+        'Gesamtbilanzen'
+
+        lci.model.cog_balance = pe.Constraint(
+            expr=0 == - lci.model.cog_steelMill + lci.model.connect_lp['Mill gas COG [kg]'])
+        lci.model.bfg_balance = pe.Constraint(
+            expr=0 == - lci.model.bfg_steelMill + lci.model.connect_lp['Mill gas BFG/BOFG [kg]'])
+        lci.model.electricity_balance = pe.Constraint(
+            expr=0 == - lci.model.electricity_steelMill + lci.model.connect_lp['Electricity [MJ]'])
+        lci.model.heat_balance = pe.Constraint(expr=0 == - lci.model.heat_steelMill + lci.model.connect_lp['Heat [MJ]'])
+
+        'Ab hier wird das Modell mit der LCI-Klasse zusammengebaut'
+
+        lci.set_up_lp(scale)
+        lci.import_connector(connector_lp)  # Durch deaktivieren dieser Zeile wird nur die Chem. Ind. betrachtet
 
     # lci.activate_scenario('Electricity Today')
     # lci.activate_scenario('Electricity Best Case')
@@ -74,31 +95,64 @@ def rep_solve_tcm(x):
     # lci.activate_scenario('No high TRL CCU')
     lci.deactivate_process('CARBON DIOXIDE - ammonia plant')
     lci.deactivate_process('Water gas shift reaction')
-    lci.lp.ammonia_constraint = pe.Constraint(
-        expr=lci.lp.s['AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture'] - 228.9 <= 0)
+    lci.set_process_cap('AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture', 228.9)
     lci.deactivate_process('TDI - neue Route_v2 exklusive Methylformate production')
     lci.deactivate_process('Polycarbonate - neue Route')
     lci.deactivate_process('Methylformate productionaus TDI neue Route v2')
 
-    lci.construct_demand_constraints()
-    lci.construct_objective()
+    lci.presolve()  # Removes processes and flows, which cannot carry flow in this scenario
+
+    if engine != 'matrix':
+        lci.construct_demand_constraints()
+        lci.construct_objective()
+
+        lci.model.add_component('lp', lci.lp)
 
-    lci.model.add_component('lp', lci.lp)
+    return lci
+
+
+def rep_solve_tcm(lci, x, solver, solver_name='glpk', persistent=False):
+    """
+    solver: Solver object, which is re-used for all points (keeps persistent solvers alive)
+    """
+    lci.set_impact('Electricity, user-defined', x)
 
     'Lösen und Ergebnisse darstellen'
 
     # lci.model.pprint()
 
-    solver = Solver()
-    solver.solve_lp(lci, 'glpk')
+    if lci.lp is None:
+        z = solver.solve_matrix(lci)['objective']
+        ok = True  # solve_matrix raises an error if HiGHS fails
+    else:
+        record = solver.solve_lp(lci, solver_name, persistent)
+        z = pe.value(lci.objective) if record.ok else None
+        ok = record.ok
     # solver.test_feasibility() # Muss an neue Demand-Constraints angepasst werden
 
-    results = {'x': x, 'z': pe.value(lci.objective) * lci.scale}
+    results = {'x': x, 'z': z * lci.scale if ok else None, 'ok': ok}
 
     return results
 
 
-def rep_solve_gdp(x):
+def interpolate_curve(curve, x):
+    """ Evaluates the piecewise linear result of Solver.solve_parametric at x """
+    n = 0
+    while n < len(curve) - 2 and curve[n + 1]['x'] < x:
+        n += 1
+    a = curve[n]
+    b = curve[n + 1] if len(curve) > 1 else curve[n]
+    if b['x'] == a['x']:
+        return {'x': x, 'z': a['z']}
+    return {'x': x, 'z': a['z'] + (b['z'] - a['z']) * (x - a['x']) / (b['x'] - a['x'])}
+
+
+def build_gdp(x):
+    """
+    Builds the combined model once. The electricity impact x is a mutable parameter of the LCI,
+    which is changed in place by rep_solve_gdp
+    """
+
     """ Separation System / Flowsheet construction """
 
     # COG Separation
@@ -124,11 +178,11 @@ def rep_solve_gdp(x):
     s.create_disjunct_reactor('methane_reforming', 'cdr', 'R2_CDR', 39, 40, 'CDR')
 
     s.model.cdr.y_37 = pe.Constraint(expr=s.model.y[37, 'CO2'] == 1)
-    s.model.cdr.add = pe.Constraint(expr=s.model.n[37] == 1 * s.model.n[36] * s.model.y[36, 'CH4'])
+    s.model.cdr.add = pe.Constraint(expr=s.model.n[37] == 1 * s.model.n[36] * s.streams[36].y['CH4'])
     s.model.cdr.q_constr = pe.Constraint(expr=s.model.q['R2_POR'] == 0)
 
     s.model.por.y_37 = pe.Constraint(expr=s.model.y[37, 'O2'] == 1)
-    s.model.por.add = pe.Constraint(expr=s.model.n[37] == 0.48 * s.model.n[36] * s.model.y[36, 'CH4'])
+    s.model.por.add = pe.Constraint(expr=s.model.n[37] == 0.48 * s.model.n[36] * s.streams[36].y['CH4'])
     s.model.por.q_constr = pe.Constraint(expr=s.model.q['R2_CDR'] == 0)
 
     # B(O)FG Separation
@@ -174,11 +228,11 @@ def rep_solve_gdp(x):
 
     'Ströme des Stahlwerks als Parameter'
 
-    s.model.cog_steelMill = pe.Param(initialize=39700000000 / scale)  # in kg, scaled
-    s.model.bfg_steelMill = pe.Param(initialize=1740550000000 / scale)  # in kg, scaled
+    s.add_scenario_parameter('cog_steelMill', 39700000000 / scale)  # in kg, scaled
+    s.add_scenario_parameter('bfg_steelMill', 1740550000000 / scale)  # in kg, scaled
 
-    s.model.electricity_steelMill = pe.Param(initialize=-2298568545000 / scale)
-    s.model.heat_steelMill = pe.Param(initialize=-894991475000 / scale)
+    s.add_scenario_parameter('electricity_steelMill', -2298568545000 / scale)
+    s.add_scenario_parameter('heat_steelMill', -894991475000 / scale)
 
     s.connect_list = ['Mill gas COG [kg]', 'Hydrogen (H2) [kg]', 'Electricity [MJ]', 'Heat [MJ]', 'SYNTHESIS GAS (1:1)',
                       'SYNTHESIS GAS (2:1)', 'Carbon dioxide (CO2) [kg]', 'Methane (CH4) [kg]', 'Oxygen (O2) [kg]',
@@ -216,7 +270,7 @@ def rep_solve_gdp(x):
     s.model.co_balance = pe.Constraint(
         expr=0 == s.model.connect_lp['Carbon monoxide (CO) [kg]'] - s.model.n[20] * molar_weight('CO'))
     s.model.ch4_balance = pe.Constraint(
-        expr=s.model.connect_lp['Methane (CH4) [kg]'] == s.model.n[35] * s.model.y[35, 'CH4'] * molar_weight('CH4'))
+        expr=s.model.connect_lp['Methane (CH4) [kg]'] == s.model.n[35] * s.streams[35].y['CH4'] * molar_weight('CH4'))
     s.model.h2_balance = pe.Constraint(
         expr=s.model.connect_lp['Hydrogen (H2) [kg]'] == s.model.n[33] * molar_weight('H2') + s.model.n[
             11] * molar_weight('H2'))
@@ -249,7 +303,7 @@ def rep_solve_gdp(x):
 
     lci = LifeCycleInventory('millgas2what')
 
-    lci.import_from_excel('Life Cycle Inventory_v19.xlsx', 'A-Matrix', 'End of life')
+    lci.import_from_excel(inventory_file, 'A-Matrix', 'End of life')
     lci.set_up_lp(scale)
     lci.import_connector(connector_lp)  # Durch deaktivieren dieser Zeile wird nur die Chem. Ind. betrachtet
 
@@ -266,12 +320,13 @@ def rep_solve_gdp(x):
     lci.activate_scenario('CCU high TRL only')
     lci.deactivate_process('CARBON DIOXIDE - ammonia plant')
     lci.deactivate_process('Water gas shift reaction')
-    lci.lp.ammonia_constraint = pe.Constraint(
-        expr=lci.lp.s['AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture'] - 228.9 <= 0)
+    lci.set_process_cap('AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture', 228.9)
     lci.deactivate_process('TDI - neue Route_v2 exklusive Methylformate production')
     lci.deactivate_process('Polycarbonate - neue Route')
     lci.deactivate_process('Methylformate productionaus TDI neue Route v2')
 
+    lci.presolve()  # Removes processes and flows, which cannot carry flow in this scenario
+
     lci.construct_demand_constraints()
     lci.construct_objective()
 
@@ -279,9 +334,23 @@ def rep_solve_gdp(x):
 
     s.create_disjunctions()
 
-    """ Solve overall model """
+    return s
+
+
+def rep_solve_gdp(s, x, solver, warm_start=None):
+    """
+    Solves the combined model s (see build_gdp) for the electricity impact x
+    solver: Solver object, which is re-used for all points
+    warm_start: (optional) solution of a neighbouring point, see Solver.solve_gdp.
+    If the warm started solve fails, the point is solved again from set covering and an initialized flowsheet.
+    Failed points are returned with 'ok': False and 'z': None, the solve record is stored under 'solve'
+    """
+    lci = s.lci
+    connector_lp = lci.connector
 
-    solver = Solver()
+    lci.set_impact('Electricity, user-defined', x)
+
+    """ Solve overall model """
 
     """ Save values in dict"""
 
@@ -300,8 +369,15 @@ def rep_solve_gdp(x):
                    'AMMONIA FROM NATURAL GAS BY STEAM REFORMING BY ICI "AMV" PROCESS incl CO2 capture',
                    'CARBON DIOXIDE - air capture', 'Electricity, user-defined']
 
-    try:
-        solver.solve_gdp(s)
+    record = solver.solve_gdp(s, warm_start)
+    if not record.ok and warm_start is not None:
+        print('Warm started solve failed at x =', x, '(' + repr(record) + '), retrying with set covering')
+        record = solver.solve_gdp(s, initialize=True)  # Starts from the flowsheet, not from the failed solve
+    if not record.ok:
+        print('Solve failed at x =', x, '(' + repr(record) + ')')
+
+    obj = None
+    if record.ok:
         obj = pe.value(s.objective)
         for d in s.disjuncts.keys():
             ind_var[d] = pe.value(s.disjuncts[d].indicator_var)
@@ -314,7 +390,7 @@ def rep_solve_gdp(x):
         for c in s.model.workSet:
             el_val[c] = pe.value(s.model.w[c]) * lci.scale
         for i in s_dict_list:
-            s_dict[i] = pe.value(s.model.utilization.s[i]) * lci.scale
+            s_dict[i] = lci.process_level(i) * lci.scale
         'Diagramme für COG / B(O)FG'
         cog_dict['H2'] = pe.value(s.model.n[33]) * molar_weight({'H2': 1}) * lci.scale
         cog_dict['N2'] = pe.value(s.model.n[35]) * pe.value(s.model.y[35, 'N2']) * molar_weight({'N2': 1}) * lci.scale
@@ -323,27 +399,65 @@ def rep_solve_gdp(x):
         cog_dict['N2'] = pe.value(s.model.n[12]) * pe.value(s.model.y[12, 'N2']) * molar_weight({'N2': 1}) * lci.scale
         bfg_dict['CO2'] = pe.value(s.model.n[8]) * molar_weight({'CO2': 1}) * lci.scale
 
-    except ValueError:
-        obj = 0
-
-    return {'x': x, 'z': obj * lci.scale, 'i': ind_var, 'c': c_val, 'rec': rec_val, 'q': heat_val, 'w': el_val,
-            's': s_dict, 'cog': cog_dict, 'bfg': bfg_dict}
+    return {'x': x, 'z': obj * lci.scale if record.ok else None, 'i': ind_var, 'c': c_val, 'rec': rec_val,
+            'q': heat_val, 'w': el_val, 's': s_dict, 'cog': cog_dict, 'bfg': bfg_dict,
+            'ok': record.ok, 'solve': record.as_dict()}
 
 
 x_vector = range_len(0.002, 0.2, 30)
 
-results_tcm = {}
-results_gdp = {}
-
-n = 0
-while n < len(x_vector):
-    results_tcm[n] = rep_solve_tcm(x_vector[n])
-    print('TCM solved', n + 1)
-    results_gdp[n] = rep_solve_gdp(x_vector[n])
-    print('GDP solved', n + 1)
-    n += 1
-
-results = {'tcm': results_tcm, 'gdp': results_gdp}
+tcm_engine = 'pyomo'  # 'matrix' solves the TCM with HiGHS without building a pyomo model
+
+tcm_parametric = False  # True: exact breakpoints of the TCM curve instead of one solve per x
+tcm_solver_name = 'glpk'
+tcm_persistent = False  # True: keep the TCM loaded in a persistent solver, e.g. tcm_solver_name = 'gurobi_persistent'
+
+sweep_processes = 1  # Number of worker processes for the sweep, None uses all cores
+sweep_journal = '20200825_v19_tcm.journal'  # Finished points are stored here, a restarted sweep skips them
+inventory_file = 'Life Cycle Inventory_v19.xlsx'
+sweep_profile = False  # True: store build and solve phases of each point (see utils.profiling) in results['profile']
+# Sources of the model and the solvers, which are covered by the journal hash (not plot, test or sweep scripts)
+model_sources = ['repeated_solving_el_impact.py', 'lci.py', 'superstructure.py', 'utils/properties.py',
+                 'utils/reactions.py', 'utils/utils.py', 'utils/initialization.py', 'utils/scaling.py',
+                 'utils/solve_model.py', 'utils/inventory_cache.py']
+
+
+def sweep_settings():
+    """
+    Settings, which change the results of a point. A journal written with other settings is not resumed.
+    Solver options and model formulation are covered by the hash of the model sources, the inventory by its content
+    """
+    sources = model_sources + glob.glob('samples/*.py')
+    return {'tcm_engine': tcm_engine, 'tcm_parametric': tcm_parametric,
+            'tcm_solver_name': tcm_solver_name, 'tcm_persistent': tcm_persistent,
+            'thermo_model': properties.thermo_model, 'files': file_hash([inventory_file] + sources)}
+
+
+def sweep_models():
+    """ Builds the models of one sweep worker once """
+    if sweep_profile:
+        profiler.enable()
+    models = {'gdp': build_gdp(x_vector[0]), 'gdp_solver': Solver(),
+              'gdp_warm_start': None}  # Solution of the previous point, which is used as starting point for the next
+    if not tcm_parametric:
+        models['tcm'] = build_tcm(x_vector[0], tcm_engine)
+        models['tcm_solver'] = Solver()
+    return models
+
+
+def sweep_point(models, x):
+    """ Solves TCM and combined model for one electricity impact x """
+    results_point = {}
+    with profiler.phase('sweep.point'):
+        if not tcm_parametric:
+            results_point['tcm'] = rep_solve_tcm(models['tcm'], x, models['tcm_solver'], tcm_solver_name,
+                                                 tcm_persistent)
+        results_point['gdp'] = rep_solve_gdp(models['gdp'], x, models['gdp_solver'], models['gdp_warm_start'])
+        if results_point['gdp']['ok']:
+            models['gdp_warm_start'] = store_solution(models['gdp'].model)
+    if profiler.enabled:
+        results_point['profile'] = profiler.take()  # The first point of a worker includes the model build
+    return results_point
 
 
 def save_object(obj, filename):
@@ -351,5 +465,31 @@ def save_object(obj, filename):
         pickle.dump(obj, output, pickle.HIGHEST_PROTOCOL)
 
 
-# name = input("enter file name")
-save_object(results, '20200825_v19_tcm')
+if __name__ == '__main__':
+
+    results = run_sweep(x_vector, sweep_models, sweep_point, sweep_processes, journal=sweep_journal,
+                        settings=sweep_settings())
+
+    if tcm_parametric:
+        lci_tcm = build_tcm(x_vector[0], tcm_engine)
+        results_tcm_curve = Solver().solve_parametric(lci_tcm, 'Electricity, user-defined', x_vector[0], x_vector[-1],
+                                                      'matrix' if tcm_engine == 'matrix' else 'glpk')
+        print('TCM breakpoints', len(results_tcm_curve))
+        results['tcm_curve'] = results_tcm_curve  # Exact piecewise linear curve, see plot_results_tcm
+
+        results['tcm'] = {}
+        n = 0
+        while n < len(x_vector):
+            results['tcm'][n] = interpolate_curve(results_tcm_curve, x_vector[n])
+            n += 1
+
+    if sweep_profile:
+        records = [r for n in sorted(results['profile'].keys()) for r in results['profile'][n]]
+        print(profiler.to_table(records))
+        profiler.save_json('20200825_v19_tcm_profile.json', records)
+
+    results = {key: results[key] for key in ('tcm', 'gdp', 'tcm_curve') if key in results.keys()}
+
+    # name = input("enter file name")
+    save_object(results, '20200825_v19_tcm')
+    os.remove(sweep_journal)  # All points are in the results file
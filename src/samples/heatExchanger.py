@@ -19,16 +19,19 @@ class HeatExchanger():
 
     def set_constraints(self):
 
-        self.unit_block.heatx_mb = pe.Constraint(expr=self.stream_in.n == self.stream_out.n)  # mole balance
+        # Flow rate and mole fractions are shared with the inlet in reduced space (see Superstructure.alias_stream)
+        if self.stream_out.n is not self.stream_in.n:
+            self.unit_block.heatx_mb = pe.Constraint(expr=self.stream_in.n == self.stream_out.n)  # mole balance
 
-        self.unit_block.heatx_cb = pe.ConstraintList()
-        self.unit_block.heatx_cb.construct()
+        if self.stream_out.y is not self.stream_in.y:
+            self.unit_block.heatx_cb = pe.ConstraintList()
+            self.unit_block.heatx_cb.construct()
 
-        for k in self.stream_in.substances:
-            if k != 'H2O':
-                self.unit_block.heatx_cb.add(expr=self.stream_out.y[k] == self.stream_in.y[k])  # component balances
+            for k in self.stream_in.substances:
+                if k != 'H2O':
+                    self.unit_block.heatx_cb.add(expr=self.stream_out.y[k] == self.stream_in.y[k])  # component balances
 
-        self.unit_block.heatx_cc = pe.Constraint(expr=self.stream_out.y['H2O'] == 1 - self.stream_out.y['CO'] - self.stream_out.y['CO2'] - self.stream_out.y['H2'] - self.stream_out.y['O2'] - self.stream_out.y['N2'] - self.stream_out.y['CH4'])
+            self.unit_block.heatx_cc = pe.Constraint(expr=self.stream_out.y['H2O'] == 1 - self.stream_out.y['CO'] - self.stream_out.y['CO2'] - self.stream_out.y['H2'] - self.stream_out.y['O2'] - self.stream_out.y['N2'] - self.stream_out.y['CH4'])
 
         self.unit_block.heatx_eb = pe.Constraint(expr=self.q == (calc_enthalpy(self.stream_out) - calc_enthalpy(self.stream_in)) / 0.7 * self.stream_in.n)  # energy balance
 
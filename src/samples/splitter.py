@@ -31,14 +31,19 @@ class Splitter():
         self.unit_block.split_cb.construct()
         self.unit_block.split_y.construct()
 
+        # Mole fractions of the outlets are shared with the inlet in reduced space (see Superstructure.alias_stream)
         for k in self.stream_in.substances:
             if k != 'H2O':
-                self.unit_block.split_y.add(expr=self.stream_in.y[k] == self.stream_prod.y[k])
-                self.unit_block.split_cb.add(expr=self.stream_in.y[k] == self.stream_bp.y[k])
+                if self.stream_prod.y is not self.stream_in.y:
+                    self.unit_block.split_y.add(expr=self.stream_in.y[k] == self.stream_prod.y[k])
+                if self.stream_bp.y is not self.stream_in.y:
+                    self.unit_block.split_cb.add(expr=self.stream_in.y[k] == self.stream_bp.y[k])
                 # self.unit_block.split_cb.add(expr=self.stream_in.n * self.stream_in.y[k] == self.stream_prod.n * self.stream_prod.y[k] + self.stream_bp.n * self.stream_bp.y[k])
 
-        self.unit_block.split_cc_prod = pe.Constraint(
-            expr=1 == sum_rule(self.stream_prod.y, self.stream_in.substances))
+        if self.stream_prod.y is not self.stream_in.y:
+            self.unit_block.split_cc_prod = pe.Constraint(
+                expr=1 == sum_rule(self.stream_prod.y, self.stream_in.substances))
 
-        self.unit_block.split_cc_bp = pe.Constraint(
-            expr=1 == sum_rule(self.stream_bp.y, self.stream_in.substances))
+        if self.stream_bp.y is not self.stream_in.y:
+            self.unit_block.split_cc_bp = pe.Constraint(
+                expr=1 == sum_rule(self.stream_bp.y, self.stream_in.substances))
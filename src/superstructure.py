@@ -1,5 +1,6 @@
 import pyomo.environ as pe
 import pyomo.gdp as gdp
+from pyomo.common.collections import ComponentMap
 from samples.compressor import Compressor
 from samples.heatExchanger import HeatExchanger
 from samples.separator import Separator
@@ -11,16 +12,29 @@ from samples.mixer import Mixer
 from samples.cca import CCA
 from samples.splitter import Splitter
 from utils.utils import Stream, sum_rule, sum_rule_heat
-from utils.properties import molar_weight
+from utils.properties import molar_weight, enthalpy_expression, kappa_expression
+from utils.profiling import profiler
+from utils.initialization import initialize_flowsheet
+from utils.scaling import jacobian, scaling_factors, apply_scaling, jacobian_statistics, no_worse
+
+
+# Reduced space: unit types, whose outlets keep the inlet composition, and whether they keep the flow rate as well
+composition_preserving = {'Heat Exchanger': True, 'Compressor': True, 'Splitter': False}
 
 
 class Superstructure():
     """
     This class sets up an flowsheet superstructure optimization problem
     """
-    def __init__(self, name):
-        """ Creates (concrete) pyomo Model"""
+    def __init__(self, name, reduced_space=False):
+        """
+        Creates (concrete) pyomo Model
+        reduced_space: outlets of composition-preserving units (see composition_preserving) share the
+        variables of their inlet instead of copying them with equality constraints, see alias_stream.
+        Units within disjuncts are not affected, as the equalities only hold if the disjunct is active
+        """
         self.name = name
+        self.reduced_space = reduced_space
         self.solver_used = None
         self.model = pe.ConcreteModel(name)
         self.setupSets()
@@ -31,6 +45,7 @@ class Superstructure():
         self.objective = None
         self.solver_timer = 0
 
+    @profiler.profile('superstructure.import_lci')
     def import_lci(self, lci):
         self.lci = lci
         self.model.add_component('utilization', lci.lp)  # Add LP block to overall model
@@ -40,19 +55,33 @@ class Superstructure():
         """
         Defines impacts, required for separation-only objective function
         """
-        self.model.impact_electricity = pe.Param(initialize=0.1072 / 1000)  # kg CO2 / kJ (grid mix 2020)
-        # self.model.impact_electricity = pe.Param(initialize=0.002683 / 1000)  # kg CO2 / kJ (wind)
-        self.model.impact_heat = pe.Param(initialize=0.0686 / 1000)  # kg CO2 / kJ (heat from NG)
-        self.model.impact_co = pe.Param(initialize=0.579)  # kg CO2 / kg CO (conv CO prod)
-        self.model.impact_h2 = pe.Param(initialize=10.8)  # kg CO2 / kg H2 (conv H2 prod)
-        self.model.impact_co2 = pe.Param(initialize=1)  # kg CO2 / kg CO2
-        self.model.impact_o2 = pe.Param(initialize=0.144)  # kg CO2 / kg O2
-        self.model.impact_syngas_21 = pe.Param(initialize=1.9540)  # kg CO2 / kg SynGas
-        self.model.impact_steam = pe.Param(initialize=0.237)  # kg CO2 / kg Steam
+        self.add_scenario_parameter('impact_electricity', 0.1072 / 1000)  # kg CO2 / kJ (grid mix 2020)
+        # self.add_scenario_parameter('impact_electricity', 0.002683 / 1000)  # kg CO2 / kJ (wind)
+        self.add_scenario_parameter('impact_heat', 0.0686 / 1000)  # kg CO2 / kJ (heat from NG)
+        self.add_scenario_parameter('impact_co', 0.579)  # kg CO2 / kg CO (conv CO prod)
+        self.add_scenario_parameter('impact_h2', 10.8)  # kg CO2 / kg H2 (conv H2 prod)
+        self.add_scenario_parameter('impact_co2', 1)  # kg CO2 / kg CO2
+        self.add_scenario_parameter('impact_o2', 0.144)  # kg CO2 / kg O2
+        self.add_scenario_parameter('impact_syngas_21', 1.9540)  # kg CO2 / kg SynGas
+        self.add_scenario_parameter('impact_steam', 0.237)  # kg CO2 / kg Steam
+
+    def add_scenario_parameter(self, name, value):
+        """
+        Adds a mutable parameter to the model. Scenario inputs defined this way can be changed
+        with set_scenario_parameter between solves, without rebuilding the superstructure
+        """
+        self.model.add_component(name, pe.Param(initialize=value, mutable=True))
+        return self.model.component(name)
+
+    def set_scenario_parameter(self, name, value):
+        """ Changes a scenario input in place. Inputs of the imported LCI are changed via lci.set_impact """
+        self.model.component(name).set_value(value)
 
     def setupSets(self):
         """ Creates index sets required for variables """
         self.streams = {}  # Library for objects of class 'stream'
+        self.sources = {}  # Initial streams: n, t, p and y as given to initial_stream
+        self.aliases = {}  # Reduced space: outlet stream: (inlet stream, flow rate shared), see alias_stream
         self.units = {}  # Library for objects of units
 
         self.disjuncts = {}  # 04.06.2020 Added libraries for gdp
@@ -78,6 +107,7 @@ class Superstructure():
         self.model.subst_set = self.model.streamSet * self.model.substances
 
 
+    @profiler.profile('superstructure.setup')
     def setupVariables(self):
         """ Initializes flowsheet variables, based on index sets """
 
@@ -91,6 +121,10 @@ class Superstructure():
 
         self.model.y = pe.Var(self.model.subst_set, initialize=0, bounds=(0, 1))  # mole fractions
 
+        self.model.h = pe.Expression(self.model.streamSet)  # molar enthalpy in MJ/mol, see create_streams
+
+        self.model.kappa = pe.Expression(self.model.streamSet)  # isentropic exponent
+
 
         'Unit variables'
         self.model.w = pe.Var(self.model.workSet, initialize=0, bounds=(0, 2000))  # work in kW
@@ -112,15 +146,46 @@ class Superstructure():
 
     def create_streams(self, i_1, i_2=0, i_3=0):
         """ Creates required streams (up to three), if they do not exist already """
-        if i_1 not in self.model.streamSet:  # Check if i_in exists as stream index
-            self.model.streamSet.add(i_1)
-            self.streams[i_1] = Stream(i_1, self.model.n[i_1], self.model.t[i_1], self.model.p[i_1], self.model.y, self.model.substances)
-        if i_2 != 0 and i_2 not in self.model.streamSet:
-            self.model.streamSet.add(i_2)  # Check if i_prod exists as stream index
-            self.streams[i_2] = Stream(i_2, self.model.n[i_2], self.model.t[i_2], self.model.p[i_2], self.model.y, self.model.substances)
-        if i_3 != 0 and i_3 not in self.model.streamSet:  # Check if i_bp is required and exists as stream index
-            self.model.streamSet.add(i_3)
-            self.streams[i_3] = Stream(i_3, self.model.n[i_3], self.model.t[i_3], self.model.p[i_3], self.model.y, self.model.substances)
+        for i in (i_1, i_2, i_3):
+            if i != 0 and i not in self.model.streamSet:  # Check if i exists as stream index
+                self.model.streamSet.add(i)
+                self.add_stream(Stream(i, self.model.n[i], self.model.t[i], self.model.p[i], self.model.y,
+                                       self.model.substances))
+
+    def add_stream(self, stream):
+        """ Adds stream to the streams library """
+        self.streams[stream.i] = stream
+        # Enthalpy and kappa are built once per stream and shared by all units of the stream
+        stream.h = self.model.h.add(stream.i, enthalpy_expression(stream))
+        stream.kappa = self.model.kappa.add(stream.i, kappa_expression(stream))
+
+    def alias_stream(self, i, i_in, flow=True):
+        """
+        Creates stream i, which uses the mole fractions (and, if flow, the flow rate) of stream i_in instead of
+        own variables. Units detect shared variables and leave out the corresponding equality constraints.
+        The own variables s.model.y[i, k] (and s.model.n[i]) stay in the model, but are not part of any unit
+        constraint. Additional constraints must therefore use s.streams[i]. Their values are set by sync_aliases.
+        Streams, which exist already, are not aliased (returns False)
+        """
+        if i == 0 or i in self.model.streamSet:
+            return False
+        self.create_streams(i_in)
+        self.model.streamSet.add(i)
+        stream = Stream(i, self.model.n[i], self.model.t[i], self.model.p[i], self.model.y, self.model.substances)
+        stream.y = self.streams[i_in].y
+        if flow:
+            stream.n = self.streams[i_in].n
+        self.add_stream(stream)
+        self.aliases[i] = (i_in, flow)
+        return True
+
+    def sync_aliases(self):
+        """ Copies the values of shared variables to the own variables of aliased streams, e.g. for ResultManager """
+        for i in self.aliases.keys():
+            for k in self.model.substances:
+                self.model.y[i, k].set_value(pe.value(self.streams[i].y[k]))
+            if self.aliases[i][1]:
+                self.model.n[i].set_value(pe.value(self.streams[i].n))
 
     def initial_stream(self, i, n, t, p, y):
         """
@@ -169,6 +234,18 @@ class Superstructure():
         for k in self.model.substances:
             self.model.initial_y.add(expr=self.model.y[i, k] == y_init[k])
 
+        self.sources[i] = {'n': n, 't': t, 'p': p, 'y': y_init}
+
+    @profiler.profile('superstructure.initialize')
+    def initialize(self):
+        """
+        Sets starting values of all stream and unit variables by evaluating the units forward from the
+        initial streams with nominal recoveries, split ratios and conversions (see utils.initialization).
+        Returns the evaluated units in order and the units, which could not be reached
+        """
+        return initialize_flowsheet(self)
+
+    @profiler.profile('superstructure.create_unit')
     def mix_streams(self, name, i_in_1, i_in_2, i_out):
 
         self.create_streams(i_in_1, i_in_2, i_out)
@@ -211,6 +288,7 @@ class Superstructure():
             self.units[name] = MSP(self.streams[i_in], self.streams[i_prod], self.streams[i_bp], self.model.zeta[name],
                                    k_prod)
 
+    @profiler.profile('superstructure.create_unit')
     def create_unit(self, unit_type, name, i_in, i_prod, i_bp=0, k_prod=0):
         """
         unit_type: Type of the unit to be created, e.g. 'Compressor'
@@ -218,8 +296,13 @@ class Superstructure():
         i_in: Index of input stream, e.g. 1
         i_prod: Index of output (product) stream, e.g. 2
         i_bp: (optional) Index of output (by-product) stream
+        In reduced space, new outlets of composition-preserving units are aliased to the inlet (see alias_stream)
         """
 
+        if self.reduced_space and unit_type in composition_preserving.keys():
+            for i in (i_prod, i_bp):
+                self.alias_stream(i, i_in, composition_preserving[unit_type])
+
         self.create_streams(i_in, i_prod, i_bp)
 
         self.prepare_unit(unit_type, name, i_in, i_prod, i_bp, k_prod)
@@ -241,6 +324,7 @@ class Superstructure():
 
             self.disjunction_sets[name_disjunction].append(self.disjuncts[name_disjunct])
 
+    @profiler.profile('superstructure.create_disjunctions')
     def create_disjunctions(self):
         """
         04.06.
@@ -251,6 +335,7 @@ class Superstructure():
             self.disjunctions[name_disjunction] = gdp.Disjunction(expr=self.disjunction_sets[name_disjunction])
             self.model.add_component(name_disjunction, self.disjunctions[name_disjunction])
 
+    @profiler.profile('superstructure.create_disjunct_unit')
     def create_disjunct_unit(self, name_disjunction, name_disjunct, unit_type, name, i_in, i_prod, i_bp=0, k_prod=0):
 
         self.create_streams(i_in, i_prod, i_bp)
@@ -263,6 +348,7 @@ class Superstructure():
 
         self.disjuncts[name_disjunct].add_component(name, self.units[name].unit_block)
 
+    @profiler.profile('superstructure.create_unit')
     def create_reactor(self, name, i_in, i_out, reaction1, reaction2=0):
         """
         name: Name of the reactor to be created, e.g. 'R1'
@@ -283,6 +369,7 @@ class Superstructure():
 
         self.model.add_component(name, self.units[name].unit_block)
 
+    @profiler.profile('superstructure.create_disjunct_unit')
     def create_disjunct_reactor(self, name_disjunction, name_disjunct, name, i_in, i_out, reaction1, reaction2=0):
         """
         name: Name of the reactor to be created, e.g. 'R1'
@@ -307,6 +394,33 @@ class Superstructure():
 
         self.disjuncts[name_disjunct].add_component(name, self.units[name].unit_block)
 
+    @profiler.profile('superstructure.set_scaling')
+    def set_scaling(self):
+        """
+        Writes scaling factors of the flowsheet variables and constraints to the suffix model.scaling_factor
+        and those of the imported LCI to its own suffix (see LifeCycleInventory.set_scaling), used by ipopt with
+        nlp_scaling_method=user-scaling. Factors are derived from the current values, so the flowsheet
+        should be initialized first (see initialize).
+        The factors are not applied if they make the Jacobian of the whole model worse (see no_worse).
+        Returns the Jacobian statistics of the whole model before and after scaling, the factors and 'applied'
+        """
+        entries = jacobian(self.model)
+        exclude = [self.model.utilization] if self.lci is not None else []
+        factors = scaling_factors(self.model, entries, exclude)
+        combined = ComponentMap(factors)
+        lci_factors = ComponentMap()
+        if self.lci is not None:
+            lci_factors = self.lci.set_scaling(entries, factors, apply=False)['factors']
+            combined.update(lci_factors)
+        before = jacobian_statistics(entries)
+        after = jacobian_statistics(entries, combined)
+        applied = no_worse(before, after)
+        if applied:
+            apply_scaling(self.model, factors)
+            if self.lci is not None:
+                apply_scaling(self.lci.lp, lci_factors)
+        return {'before': before, 'after': after, 'factors': combined, 'applied': applied}
+
     def setupConstraints(self):
         """
         Sets up further constraints, which do not belong to a certain unit operation,
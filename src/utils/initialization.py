@@ -0,0 +1,288 @@
+import numpy as np
+from utils.properties import substances, enthalpy_batch, heat_capacity_batch, kappa_batch, molar_weight, \
+    calc_beta_psa, calc_alpha_msp, calc_c_p_solid
+from utils.reactions import calc_dHr, calc_k_key, calc_ny
+
+"""
+Sequential-modular initialization of a superstructure: the units are evaluated forward from the initial
+streams in topological order with nominal recoveries, split ratios and conversions. The resulting stream
+states and unit variables (n, t, p, y, q, w, ...) are written to the model as starting point for the NLPs
+"""
+
+n_source = 1000  # [mol/s] Flow of initial streams, which are optimization DoF (n=0 in initial_stream)
+p_compressor = 10  # [bar] Outlet pressure of compressors, unless the next unit requires another pressure
+split = 0.5  # Split ratio of splitters
+zeta = {'Pressure Swing Adsorption': 0.8, 'Membrane Separation Process': 0.8,
+        'Temperature Swing Adsorption': 0.9, 'Chemical Absorption': 0.9}  # Product recoveries
+
+# Temperature windows of the reactors [K], see samples.reactor (POR: only t_in >= 1000, 1073 K nominal)
+reactor_temperature = {'WGSR': (600, 800), 'CDR': (1143, 1313), 'POR': (1000, 1073), 'SMR': (1153, 1300)}
+
+
+def nominal_conversions(unit):
+    """ Conversions of reaction 1 and 2 of a reactor, as fixed in samples.reactor """
+    if unit.reaction1 == 'SMR' and unit.reaction2 == 'WGSR':
+        return 0.815, 0.402
+    conversion = {'WGSR': 0.96, 'CDR': 0.9, 'POR': 0.95}
+    return conversion[unit.reaction1], 0
+
+
+def inlet_requirement(unit):
+    """ Returns the inlet temperature [K] and pressure [bar] a unit requires, None if it is not fixed """
+    if unit.unit_type == 'Temperature Swing Adsorption':
+        return unit.t_ads, None
+    elif unit.unit_type == 'Chemical Absorption':
+        return 40 + 273.15, 1.5
+    elif unit.unit_type == 'Reactor':
+        t_min, t_max = reactor_temperature[unit.reaction1]
+        return (t_min + t_max) / 2, None
+    return None, None
+
+
+def _state(n, t, p, y):
+    return {'n': float(n), 't': float(t), 'p': float(p), 'y': np.asarray(y, dtype=float)}
+
+
+def _from_flows(n_k, t, p, y_default):
+    """ Stream state from component flows [mol/s], y_default if the stream has no flow """
+    n_k = np.maximum(n_k, 0)
+    n = n_k.sum()
+    return _state(n, t, p, n_k / n if n > 0 else y_default)
+
+
+def _pure(k, n, t, p):
+    y = np.zeros(len(substances))
+    y[substances.index(k)] = 1
+    return _state(n, t, p, y)
+
+
+def _enthalpy(state):
+    return enthalpy_batch(state['t'], state['y'])[0]
+
+
+def _temperature(h, y, t):
+    """ Temperature [K] of a stream with molar enthalpy h [MJ/mol] and mole fractions y (Newton, from t) """
+    for _ in range(50):
+        dt = (enthalpy_batch(t, y)[0] - h) / (heat_capacity_batch(t, y)[0] / 1000000)
+        t = min(max(t - dt, 200), 2000)
+        if abs(dt) < 1E-6:
+            break
+    return t
+
+
+def _separate(unit, s_in, zeta_unit):
+    """ Product and by-product of a separation with pure product (PSA, TSA, CCA), see samples.separator """
+    j = substances.index(unit.k_prod)
+    prod = _pure(unit.k_prod, zeta_unit * s_in['n'] * s_in['y'][j], s_in['t'], s_in['p'])
+    bp = _from_flows(s_in['n'] * s_in['y'] - prod['n'] * prod['y'], s_in['t'], s_in['p'], s_in['y'])
+    return prod, bp
+
+
+def _membrane(unit, s_in, zeta_unit):
+    """ Permeate and retentate of samples.msp, the permeate composition is found by fixed-point iteration """
+    kp = unit.k_prod
+    j = substances.index(kp)
+    y_in = s_in['y']
+    p_prod = 1
+    n_k = np.zeros(len(substances))
+    n_k[j] = zeta_unit * s_in['n'] * y_in[j]
+    y_prod = 1
+    for _ in range(50):
+        for m, k in enumerate(substances):
+            if k != kp and k != 'H2O':
+                alpha = calc_alpha_msp(k, kp)
+                d = y_in[j] * (2 - zeta_unit - alpha * zeta_unit / (1 - y_in[j] * zeta_unit)) - \
+                    2 * y_prod * p_prod * (1 - alpha) / s_in['p']
+                n_k[m] = min(alpha * zeta_unit * y_in[m] * s_in['n'] * y_in[j] / d, s_in['n'] * y_in[m]) if d > 0 else 0
+        if n_k.sum() <= 0:
+            break
+        y_prod = n_k[j] / n_k.sum()
+    prod = _from_flows(n_k, s_in['t'], p_prod, y_in)
+    bp = _from_flows(s_in['n'] * y_in - n_k, s_in['t'], s_in['p'], y_in)
+    return prod, bp
+
+
+def _react(unit, s_in):
+    """ Outlet and heat of samples.reactor at nominal conversions """
+    x1, x2 = nominal_conversions(unit)
+    r1, r2 = unit.reaction1, unit.reaction2
+    k1 = calc_k_key(r1)
+    y_in = dict(zip(substances, s_in['y']))
+    e1 = x1 * y_in[k1]  # Extents per mol of inlet
+    e2 = 0
+    if r2 != 0:
+        k2 = calc_k_key(r2)
+        e2 = x2 * (y_in[k2] - calc_ny(r1, k2) / calc_ny(r1, k1) * e1)
+    n_k = np.zeros(len(substances))
+    for m, k in enumerate(substances):
+        n_k[m] = s_in['n'] * (y_in[k] - calc_ny(r1, k) / calc_ny(r1, k1) * e1)
+        if r2 != 0:
+            n_k[m] -= s_in['n'] * calc_ny(r2, k) / calc_ny(r2, k2) * e2
+    n_out = s_in['n'] * (1 + calc_ny(r1, 'sum') * e1 + (calc_ny(r2, 'sum') * e2 if r2 != 0 else 0))
+
+    t_min, t_max = reactor_temperature[r1]
+    p_out = 1 if r1 == 'CDR' else s_in['p']
+    s_out = _from_flows(n_k, min(max(s_in['t'], t_min), t_max), p_out, s_in['y'])
+    s_out['n'] = n_out
+    h_react = s_in['n'] * (_enthalpy(s_in) - e1 * calc_dHr(r1) - (e2 * calc_dHr(r2) if r2 != 0 else 0))
+    if r1 == 'POR':  # Adiabatic (q = 0)
+        s_out['t'] = _temperature(h_react / n_out, s_out['y'], s_out['t']) if n_out > 0 else s_out['t']
+        q = 0
+    elif r2 != 0:  # q is not part of the energy balance with two reactions, the temperature window is kept
+        q = 0
+    else:
+        q = (_enthalpy(s_out) * n_out - h_react) / 0.7
+    return s_out, q, x1, x2
+
+
+def _set(var, value):
+    """ Sets the value of a variable within its bounds, fixed variables are not changed """
+    if var.fixed:
+        return
+    value = float(value)
+    if var.lb is not None:
+        value = max(value, var.lb)
+    if var.ub is not None:
+        value = min(value, var.ub)
+    var.set_value(value)
+
+
+def _write_stream(stream, state):
+    _set(stream.n, state['n'])
+    _set(stream.t, state['t'])
+    _set(stream.p, state['p'])
+    for m, k in enumerate(substances):
+        _set(stream.y[k], state['y'][m])
+
+
+def _ports(unit):
+    a = unit.unit_attributes
+    inlets = [a[i] for i in ('i_in', 'i_in_1', 'i_in_2') if i in a.keys()]
+    outlets = [a[i] for i in ('i_out', 'i_prod', 'i_bp') if i in a.keys() and a[i] != 0]
+    return inlets, outlets
+
+
+def evaluate_unit(unit, inlets, requirement):
+    """
+    Evaluates a unit forward. Returns the outlet states {stream index: state} and the values of the unit
+    variables as list of (variable, value)
+        inlets:         inlet states {stream index: state}
+        requirement:    (t, p) required by the unit downstream of a heat exchanger or compressor
+    """
+    a = unit.unit_attributes
+    outlets = {}
+    values = []
+    if unit.unit_type == 'Mixer':
+        s_1, s_2 = inlets[a['i_in_1']], inlets[a['i_in_2']]
+        n_k = s_1['n'] * s_1['y'] + s_2['n'] * s_2['y']
+        s_out = _from_flows(n_k, s_1['t'], min(s_1['p'], s_2['p']), s_1['y'])
+        if s_out['n'] > 0:
+            h = (s_1['n'] * _enthalpy(s_1) + s_2['n'] * _enthalpy(s_2)) / s_out['n']
+            s_out['t'] = _temperature(h, s_out['y'], (s_1['n'] * s_1['t'] + s_2['n'] * s_2['t']) / s_out['n'])
+        outlets[a['i_out']] = s_out
+        return outlets, values
+
+    s_in = inlets[a['i_in']]
+    if unit.unit_type == 'Compressor':
+        p_out = max(requirement[1] if requirement[1] is not None else p_compressor, s_in['p'])
+        kappa = kappa_batch(s_in['t'], s_in['y'])[0]
+        s_out = _state(s_in['n'], s_in['t'] * (p_out / s_in['p']) ** ((kappa - 1) / kappa), p_out, s_in['y'])
+        outlets[a['i_out']] = s_out
+        values.append((unit.w, (_enthalpy(s_out) - _enthalpy(s_in)) / 0.7 * s_in['n']))
+    elif unit.unit_type == 'Heat Exchanger':
+        t_out = requirement[0] if requirement[0] is not None else s_in['t']
+        s_out = _state(s_in['n'], t_out, s_in['p'], s_in['y'])
+        outlets[a['i_out']] = s_out
+        values.append((unit.q, (_enthalpy(s_out) - _enthalpy(s_in)) / 0.7 * s_in['n']))
+    elif unit.unit_type == 'Splitter':
+        outlets[a['i_prod']] = _state(split * s_in['n'], s_in['t'], s_in['p'], s_in['y'])
+        outlets[a['i_bp']] = _state((1 - split) * s_in['n'], s_in['t'], s_in['p'], s_in['y'])
+        values.append((unit.split, split))
+    elif unit.unit_type == 'Pressure Swing Adsorption':
+        j = substances.index(unit.k_prod)
+        beta = calc_beta_psa(unit.k_prod)
+        zeta_unit = zeta[unit.unit_type]
+        if s_in['p'] * s_in['y'][j] > 1:  # Highest recovery with a product pressure of at least 1 bar
+            zeta_unit = min(zeta_unit, (1 - beta) * (1 - 1 / (s_in['p'] * s_in['y'][j])))
+        prod, bp = _separate(unit, s_in, zeta_unit)
+        prod['p'] = s_in['p'] * s_in['y'][j] * (1 - zeta_unit / (1 - beta))
+        outlets[a['i_prod']], outlets[a['i_bp']] = prod, bp
+        values.append((unit.zeta, zeta_unit))
+    elif unit.unit_type == 'Membrane Separation Process':
+        prod, bp = _membrane(unit, s_in, zeta[unit.unit_type])
+        outlets[a['i_prod']], outlets[a['i_bp']] = prod, bp
+        values.append((unit.zeta, zeta[unit.unit_type]))
+    elif unit.unit_type == 'Temperature Swing Adsorption':
+        prod, bp = _separate(unit, s_in, zeta[unit.unit_type])
+        prod['t'] = unit.t_des
+        outlets[a['i_prod']], outlets[a['i_bp']] = prod, bp
+        m_s = prod['n'] * molar_weight(unit.k_prod) / 1000 / (0.02 - 0.005)
+        values += [(unit.zeta, zeta[unit.unit_type]), (unit.X_rich, 0.02), (unit.X_lean, 0.005), (unit.m_s, m_s),
+                   (unit.q, calc_c_p_solid('Zeolite') * m_s * 1000 * (unit.t_des - unit.t_ads))]
+    elif unit.unit_type == 'Chemical Absorption':
+        prod, bp = _separate(unit, s_in, zeta[unit.unit_type])
+        prod['t'] = 120 + 273.15
+        outlets[a['i_prod']], outlets[a['i_bp']] = prod, bp
+        values += [(unit.zeta, zeta[unit.unit_type]),
+                   (unit.q, 4200 / 1000 * prod['n'] * molar_weight(unit.k_prod))]
+    elif unit.unit_type == 'Reactor':
+        s_out, q, x1, x2 = _react(unit, s_in)
+        outlets[a['i_out']] = s_out
+        values += [(unit.q, q), (unit.conversion1, x1)]
+        if unit.reaction2 != 0:
+            values.append((unit.conversion2, x2))
+    return outlets, values
+
+
+def initialize_flowsheet(s):
+    """
+    Walks the flowsheet of superstructure s from its initial streams in topological order and writes
+    consistent starting values to stream and unit variables. Alternative units of a disjunction are all
+    evaluated, a stream produced by several of them gets the values of the first one.
+    Streams without source and producer (e.g. make-up streams constrained in the main script) start without flow.
+    Returns the evaluated units in order and the units not reached (e.g. in a recycle), which keep their values
+    """
+    states = {}
+    for i in s.sources.keys():
+        source = s.sources[i]
+        states[i] = _state(source['n'] if source['n'] != 0 else n_source, source['t'], source['p'],
+                           [source['y'][k] for k in substances])
+
+    consumers = {}
+    produced = set()
+    for name in s.units.keys():
+        inlets, outlets = _ports(s.units[name])
+        for i in inlets:
+            consumers.setdefault(i, []).append(s.units[name])
+        produced.update(outlets)
+    for i in s.streams.keys():
+        if i not in states.keys() and i not in produced:
+            stream = s.streams[i]
+            states[i] = _state(0, stream.t.value, stream.p.value, [stream.y[k].value for k in substances])
+
+    order = []
+    pending = list(s.units.keys())
+    progress = True
+    while pending and progress:
+        progress = False
+        for name in list(pending):
+            unit = s.units[name]
+            inlets, outlets = _ports(unit)
+            if not all(i in states.keys() for i in inlets):
+                continue
+            requirement = (None, None)
+            if outlets[0] in consumers.keys():
+                requirement = inlet_requirement(consumers[outlets[0]][0])
+            unit_outlets, values = evaluate_unit(unit, {i: states[i] for i in inlets}, requirement)
+            for i in unit_outlets.keys():
+                if i not in states.keys():
+                    states[i] = unit_outlets[i]
+            for var, value in values:
+                _set(var, value)
+            pending.remove(name)
+            order.append(name)
+            progress = True
+
+    for i in states.keys():
+        _write_stream(s.streams[i], states[i])
+    return {'units': order, 'unresolved': pending}
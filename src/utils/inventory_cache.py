@@ -0,0 +1,64 @@
+import hashlib
+import os.path
+import numpy as np
+from scipy import sparse
+
+
+def inventory_key(filename, sheetname, sheetname2):
+    """ Returns a hash of the workbook content and the parsed sheet names """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as workbook:
+        for chunk in iter(lambda: workbook.read(1 << 20), b''):
+            h.update(chunk)
+    h.update(sheetname.encode('utf-8'))
+    h.update(b'\0')
+    h.update(sheetname2.encode('utf-8'))
+    return h.hexdigest()
+
+
+def cache_filename(filename, key, cache_dir=None):
+    """ Returns the path of the cache file for a workbook (next to the workbook by default) """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), '.lci_cache')
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, stem + '_' + key[:16] + '.npz')
+
+
+def save_inventory(cache_file, key, lci):
+    """ Writes A (sparse), p, b, v, process and flow names of lci into a compressed npz file """
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    A = sparse.csr_matrix(lci.A)
+    tmp_file = cache_file + '.tmp.npz'
+    np.savez_compressed(tmp_file,
+                        key=np.array(key),
+                        A_data=A.data, A_indices=A.indices, A_indptr=A.indptr, A_shape=np.array(A.shape),
+                        p=np.array(lci.p, dtype=float),
+                        b=np.array(lci.b, dtype=float),
+                        v=np.array(lci.v, dtype=float),
+                        processes=np.array(lci.processes, dtype=str),
+                        intermediate_flows=np.array(lci.intermediate_flows, dtype=str))
+    os.replace(tmp_file, cache_file)  # Readers never see a partially written cache file
+
+
+def load_inventory(cache_file, key):
+    """
+    Returns the cached inventory as dict, or None if there is no valid cache entry for key
+    """
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            if str(data['key']) != key:
+                return None
+            return {'A': sparse.csr_matrix((data['A_data'], data['A_indices'], data['A_indptr']),
+                                           shape=tuple(data['A_shape'])),
+                    'p': data['p'].tolist(),
+                    'b': data['b'].tolist(),
+                    'v': data['v'].tolist(),
+                    'processes': data['processes'].tolist(),
+                    'intermediate_flows': data['intermediate_flows'].tolist()}
+    except (OSError, KeyError, ValueError):
+        return None  # Corrupt or outdated cache files are re-created from the workbook
@@ -0,0 +1,132 @@
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler():
+    """
+    Records wall time and peak memory of named phases of model build and solve, e.g. the excel import
+    or the construction of the demand constraints. Switched off by default, then phases cost nothing.
+        enabled:    record phases
+        memory:     also record the peak memory of each phase (tracemalloc, slows down python code)
+    Phases can be nested. The peak memory of a phase includes the peaks of its inner phases.
+    """
+
+    def __init__(self, enabled=False, memory=True):
+        self.enabled = enabled
+        self.memory = memory
+        self.records = []
+        self._stack = []  # Open phases: [name, start time, memory at start, peak memory so far]
+        self._own_tracing = False
+
+    def enable(self, memory=True):
+        self.enabled = True
+        self.memory = memory
+
+    def disable(self):
+        self.enabled = False
+        if self._own_tracing and not self._stack:
+            tracemalloc.stop()
+            self._own_tracing = False
+
+    def reset(self):
+        """ Removes all recorded phases """
+        self.records = []
+
+    def take(self):
+        """ Returns the recorded phases and starts a new list, e.g. to store them with each sweep point """
+        records = self.records
+        self.records = []
+        return records
+
+    def _traced_memory(self):
+        if not self.memory:
+            return 0, 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+        return tracemalloc.get_traced_memory()
+
+    def _reset_peak(self):
+        if self.memory and hasattr(tracemalloc, 'reset_peak'):  # python >= 3.9, before: peak since start
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def phase(self, name):
+        """ Records the wall time and peak memory of the enclosed code as phase name """
+        if not self.enabled:
+            yield
+            return
+
+        current, peak = self._traced_memory()
+        if self._stack:
+            self._stack[-1][3] = max(self._stack[-1][3], peak)
+        self._reset_peak()
+        entry = [name, time.perf_counter(), current, current]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - entry[1]
+            self._stack.pop()
+            current, peak = self._traced_memory()
+            peak = max(entry[3], peak)
+            self.records.append({'phase': name, 'depth': len(self._stack), 'start': entry[1], 'wall_time': wall_time,
+                                 'peak_memory': peak / 2 ** 20 if self.memory else None,
+                                 'memory_delta': (current - entry[2]) / 2 ** 20 if self.memory else None})
+            self._reset_peak()
+            if self._stack:
+                self._stack[-1][3] = max(self._stack[-1][3], peak)
+
+    def profile(self, name):
+        """ Decorator, which records every call of a function as phase name """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.phase(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self, records=None):
+        """ Returns calls, total and maximum wall time [s] and peak memory [MB] per phase, in order of first call """
+        if records is None:
+            records = self.records
+        phases = {}
+        for r in sorted(records, key=lambda r: r['start']):
+            if r['phase'] not in phases.keys():
+                phases[r['phase']] = {'depth': r['depth'], 'calls': 0, 'wall_time': 0, 'max_wall_time': 0,
+                                      'peak_memory': None}
+            p = phases[r['phase']]
+            p['depth'] = min(p['depth'], r['depth'])
+            p['calls'] += 1
+            p['wall_time'] += r['wall_time']
+            p['max_wall_time'] = max(p['max_wall_time'], r['wall_time'])
+            if r['peak_memory'] is not None:
+                p['peak_memory'] = r['peak_memory'] if p['peak_memory'] is None else max(p['peak_memory'], r['peak_memory'])
+        return phases
+
+    def to_table(self, records=None):
+        """ Returns the summary as text table, inner phases are indented """
+        phases = self.summary(records)
+        lines = ['{:<45} {:>7} {:>12} {:>12} {:>12}'.format('Phase', 'Calls', 'Total [s]', 'Max [s]', 'Peak [MB]')]
+        for name in phases.keys():
+            p = phases[name]
+            peak = '-' if p['peak_memory'] is None else '{:.1f}'.format(p['peak_memory'])
+            lines.append('{:<45} {:>7} {:>12.3f} {:>12.3f} {:>12}'.format(
+                '  ' * p['depth'] + name, p['calls'], p['wall_time'], p['max_wall_time'], peak))
+        return '\n'.join(lines)
+
+    def save_json(self, filename, records=None):
+        """ Writes all recorded phases and their summary to a json file """
+        if records is None:
+            records = self.records
+        with open(filename, 'w') as output:
+            json.dump({'records': records, 'summary': self.summary(records)}, output, indent=2)
+
+
+profiler = Profiler()  # Shared by LifeCycleInventory, Superstructure and Solver, switched on with profiler.enable()
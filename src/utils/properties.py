@@ -1,4 +1,32 @@
 import pyomo.environ as pe
+import numpy as np
+
+
+# Shomate coefficients A, B, C, D, E, F, H of each substance (t in 1000 K, c_p in J/mol/K, h in kJ/mol),
+# as list of temperature ranges: (upper limit of the range in 1000 K, coefficients)
+shomate_table = {
+    'CO': [(float('inf'), (25.56, 6.096, 4.05, -2.67, 0.131, -118, -110.52))],
+    'CO2': [(float('inf'), (24.99, 55.19, -33.69, 7.95, -0.14, -403.61, -393.52))],
+    'H2': [(float('inf'), (33.066, -11.363, 11.43, -2.77, -0.158, -9.98, 0))],
+    'O2': [(0.7, (31.32, -20.23, 57.86, -36.5, -0.0073, -8.903, 0)),
+           (float('inf'), (30.032, 8.77, -3.988, 0.788, -0.741, -11.324, 0))],
+    'N2': [(0.5, (33.066, -11.363, 11.43, -2.77, -0.158, -9.98, 0)),
+           (float('inf'), (19.505, 19.887, -8.598, 1.369, 0.527, -4.935, 0))],
+    'CH4': [(float('inf'), (-0.703, 108.477, -42.521, 5.862, 0.678, -76.843, -74.873))],
+    'H2O': [(float('inf'), (30.092, 6.8323, 6.7934, -2.5344, 0.0843, -250.88, -241.82))],
+}
+
+
+def shomate_coefficients(k, t):
+    """
+    Returns the coefficients A-H of substance k for the temperature range, which contains the current value of t
+    t: Temperature in 1000 K
+    """
+    t_value = pe.value(t)
+    for t_max, coefficients in shomate_table[k]:
+        if t_value < t_max:
+            return coefficients
+    return shomate_table[k][-1][1]
 
 
 def shomate_parameter(j, k, t):
@@ -7,102 +35,194 @@ def shomate_parameter(j, k, t):
     k: Substance
     t: Temperature in 1000 K
     """
-    shomate_param = {}
-    shomate_param[1, 'CO'] = 25.56
-    shomate_param[2, 'CO'] = 6.096
-    shomate_param[3, 'CO'] = 4.05
-    shomate_param[4, 'CO'] = -2.67
-    shomate_param[5, 'CO'] = 0.131
-    shomate_param[6, 'CO'] = -118
-    shomate_param[7, 'CO'] = -110.52
-    shomate_param[1, 'CO2'] = 24.99
-    shomate_param[2, 'CO2'] = 55.19
-    shomate_param[3, 'CO2'] = -33.69
-    shomate_param[4, 'CO2'] = 7.95
-    shomate_param[5, 'CO2'] = -0.14
-    shomate_param[6, 'CO2'] = -403.61
-    shomate_param[7, 'CO2'] = -393.52
-    shomate_param[1, 'H2'] = 33.066
-    shomate_param[2, 'H2'] = -11.363
-    shomate_param[3, 'H2'] = 11.43
-    shomate_param[4, 'H2'] = -2.77
-    shomate_param[5, 'H2'] = -0.158
-    shomate_param[6, 'H2'] = -9.98
-    shomate_param[7, 'H2'] = 0
-    if pe.value(t) < 0.7:
-        shomate_param[1, 'O2'] = 31.32
-        shomate_param[2, 'O2'] = -20.23
-        shomate_param[3, 'O2'] = 57.86
-        shomate_param[4, 'O2'] = -36.5
-        shomate_param[5, 'O2'] = -0.0073
-        shomate_param[6, 'O2'] = -8.903
-        shomate_param[7, 'O2'] = 0
-    else:
-        shomate_param[1, 'O2'] = 30.032
-        shomate_param[2, 'O2'] = 8.77
-        shomate_param[3, 'O2'] = -3.988
-        shomate_param[4, 'O2'] = 0.788
-        shomate_param[5, 'O2'] = -0.741
-        shomate_param[6, 'O2'] = -11.324
-        shomate_param[7, 'O2'] = 0
-    if pe.value(t) < 0.5:
-        shomate_param[1, 'N2'] = 33.066
-        shomate_param[2, 'N2'] = -11.363
-        shomate_param[3, 'N2'] = 11.43
-        shomate_param[4, 'N2'] = -2.77
-        shomate_param[5, 'N2'] = -0.158
-        shomate_param[6, 'N2'] = -9.98
-        shomate_param[7, 'N2'] = 0
-    else:
-        shomate_param[1, 'N2'] = 19.505
-        shomate_param[2, 'N2'] = 19.887
-        shomate_param[3, 'N2'] = -8.598
-        shomate_param[4, 'N2'] = 1.369
-        shomate_param[5, 'N2'] = 0.527
-        shomate_param[6, 'N2'] = -4.935
-        shomate_param[7, 'N2'] = 0
-    shomate_param[1, 'CH4'] = -0.703
-    shomate_param[2, 'CH4'] = 108.477
-    shomate_param[3, 'CH4'] = -42.521
-    shomate_param[4, 'CH4'] = 5.862
-    shomate_param[5, 'CH4'] = 0.678
-    shomate_param[6, 'CH4'] = -76.843
-    shomate_param[7, 'CH4'] = -74.873
-    shomate_param[1, 'H2O'] = 30.092
-    shomate_param[2, 'H2O'] = 6.8323
-    shomate_param[3, 'H2O'] = 6.7934
-    shomate_param[4, 'H2O'] = -2.5344
-    shomate_param[5, 'H2O'] = 0.0843
-    shomate_param[6, 'H2O'] = -250.88
-    shomate_param[7, 'H2O'] = -241.82
-
-    return shomate_param[j, k]
+    return shomate_coefficients(k, t)[j - 1]
 
 
-def calc_kappa(stream):
+# Formulation of the temperature dependence of substances with several Shomate ranges (O2, N2):
+#   'blended':  smooth sigmoid transition between the ranges, valid over the full temperature bounds
+#   'refit':    one polynomial per substance, fitted to all ranges within the temperature bounds
+#   'switch':   range selected by the value of t when the model is built (formulation of the paper, default)
+# Must be set before the streams are created (see set_thermo_model)
+thermo_model = 'switch'
+blend_width = 0.01  # Width of the sigmoid transition in 1000 K
+refit_range = (0.2, 2.0)  # Temperature bounds of the streams in 1000 K (see Superstructure.setupVariables)
+_refit_coefficients = {}
+
+
+def set_thermo_model(name):
+    """ Selects the thermodynamic formulation ('blended', 'refit' or 'switch') of all streams created afterwards """
+    global thermo_model
+    if name not in ('blended', 'refit', 'switch'):
+        raise ValueError('Unknown thermo model ' + str(name))
+    thermo_model = name
+
+
+def _cp_polynomial(coefficients, t):
+    a, b, c, d, e, f, h = coefficients
+    return a + b * t + c * t ** 2 + d * t ** 3 + e * t ** (-2)  # J/mol/K
+
+
+def _h_polynomial(coefficients, t):
+    a, b, c, d, e, f, h = coefficients
+    return a * t + b * t ** 2 / 2 + c * t ** 3 / 3 + d * t ** 4 / 4 - e / t + f - h  # kJ/mol
+
+
+def _sigmoid(t, t_switch, exp=pe.exp):
+    return 1 / (1 + exp(-(t - t_switch) / blend_width))
+
+
+def refit_coefficients(k):
+    """
+    Returns one set of coefficients A-H of substance k for the whole refit_range: c_p is fitted to all
+    Shomate ranges by least squares, the enthalpy constant F matches the mean enthalpy (H = 0)
+    """
+    ranges = shomate_table[k]
+    if len(ranges) == 1:
+        return ranges[0][1]
+    if k not in _refit_coefficients.keys():
+        t = np.linspace(refit_range[0], refit_range[1], 400)
+        cp = np.zeros(len(t))
+        h = np.zeros(len(t))
+        for n in range(len(t)):
+            coefficients = shomate_coefficients(k, t[n])
+            cp[n] = _cp_polynomial(coefficients, t[n])
+            h[n] = _h_polynomial(coefficients, t[n])
+        basis = np.column_stack([np.ones(len(t)), t, t ** 2, t ** 3, t ** (-2)])
+        a, b, c, d, e = np.linalg.lstsq(basis, cp, rcond=None)[0]
+        f = np.mean(h - _h_polynomial((a, b, c, d, e, 0, 0), t))
+        _refit_coefficients[k] = tuple(float(x) for x in (a, b, c, d, e, f, 0))
+    return _refit_coefficients[k]
+
+
+def _substance_property(k, t, polynomial, exp=pe.exp, t_build=None):
+    """
+    Evaluates polynomial (c_p or h) of substance k at t [1000 K] in the selected thermo model
+    exp: exponential function of the type of t (pe.exp for pyomo expressions, np.exp for arrays)
+    t_build: (arrays, 'switch') temperatures [1000 K], which select the range of each element, default: t
+    """
+    if thermo_model == 'switch':
+        if isinstance(t, np.ndarray):  # Range of each element, as the range of a stream built at t_build
+            if t_build is None:
+                t_build = t
+            value = polynomial(shomate_table[k][-1][1], t)
+            for t_max, coefficients in reversed(shomate_table[k][:-1]):
+                value = np.where(t_build < t_max, polynomial(coefficients, t), value)
+            return value
+        return polynomial(shomate_coefficients(k, t), t)
+    if thermo_model == 'refit':
+        return polynomial(refit_coefficients(k), t)
+    ranges = shomate_table[k]
+    value = polynomial(ranges[0][1], t)
+    r = 1
+    while r < len(ranges):
+        value = value + _sigmoid(t, ranges[r - 1][0], exp) * (polynomial(ranges[r][1], t)
+                                                              - polynomial(ranges[r - 1][1], t))
+        r += 1
+    return value
+
+
+def substance_heat_capacity(k, t):
+    """ Heat capacity of substance k [J/mol/K], t in 1000 K (pyomo expression or number) """
+    return _substance_property(k, t, _cp_polynomial)
+
+
+def substance_enthalpy(k, t):
+    """ Enthalpy of substance k [kJ/mol], t in 1000 K (pyomo expression or number) """
+    return _substance_property(k, t, _h_polynomial)
+
+
+def kappa_expression(stream):
+    """ Builds the isentropic exponent of a stream from its temperature and mole fractions """
     t = stream.t / 1000
     c_p = 0
     for k in stream.substances:
-        c_p = c_p + stream.y[k] * (
-                    shomate_parameter(1, k, t) + shomate_parameter(2, k, t) * t + shomate_parameter(3, k, t)
-                    * t ** 2 + shomate_parameter(4, k, t) * t ** 3 + shomate_parameter(5, k, t) * t ** (-2))
+        c_p = c_p + stream.y[k] * substance_heat_capacity(k, t)
     kappa = c_p / (c_p - 8.314)
     return kappa
 
 
-def calc_enthalpy(stream):
+def enthalpy_expression(stream):
+    """ Builds the molar enthalpy of a stream [MJ/mol] from its temperature and mole fractions """
     t = stream.t / 1000
     h = 0
     for k in stream.substances:
-        h = h + stream.y[k] * (
-                    shomate_parameter(1, k, t) * t + shomate_parameter(2, k, t) * t ** 2 / 2 + shomate_parameter(3, k,
-                                                                                                                 t)
-                    * t ** 3 / 3 + shomate_parameter(4, k, t) * t ** 4 / 4 - shomate_parameter(5, k, t) / t +
-                    shomate_parameter(6, k, t) - shomate_parameter(7, k, t))
+        h = h + stream.y[k] * substance_enthalpy(k, t)
     h /= 1000
     return h  # enthalpy in MJ/mol
 
 
+def calc_kappa(stream):
+    """ Isentropic exponent of a stream. Streams of a superstructure share one expression (stream.kappa) """
+    if getattr(stream, 'kappa', None) is not None:
+        return stream.kappa
+    return kappa_expression(stream)
+
+
+def calc_enthalpy(stream):
+    """ Molar enthalpy of a stream [MJ/mol]. Streams of a superstructure share one expression (stream.h) """
+    if getattr(stream, 'h', None) is not None:
+        return stream.h
+    return enthalpy_expression(stream)
+
+
+substances = ['CO', 'CO2', 'H2', 'O2', 'N2', 'CH4', 'H2O']  # Order of the columns of y in the batch functions
+
+
+def _batch_input(t, y, t_build=None):
+    """
+    Converts temperatures [K] (N) and mole fractions (N x substances) to arrays, t and t_build in 1000 K
+    """
+    t = np.asarray(t, dtype=float) / 1000
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    if y.shape[1] != len(substances):
+        raise ValueError('y must have one column per substance: ' + str(substances))
+    if t_build is not None:
+        t_build = np.broadcast_to(np.asarray(t_build, dtype=float) / 1000, y.shape[:1])
+    return np.broadcast_to(t, y.shape[:1]), y, t_build
+
+
+def heat_capacity_batch(t, y, t_build=None):
+    """
+    Heat capacities of many streams [J/mol/K] in one call
+    t: temperatures [K], array (N)
+    y: mole fractions, array (N x 7) in the order of substances
+    t_build: (optional, 'switch') temperatures [K] of the streams when the model was built, array (N)
+    Evaluates the same formulation as the stream expressions (see thermo_model). In 'switch' the Shomate range
+    of a stream expression is fixed at build time, while the batch functions select it by t (default) or by
+    t_build. Without t_build they only agree with the stream expressions if each t stays in its build-time range
+    """
+    t, y, t_build = _batch_input(t, y, t_build)
+    c_p = 0
+    for j, k in enumerate(substances):
+        c_p = c_p + y[:, j] * _substance_property(k, t, _cp_polynomial, np.exp, t_build)
+    return c_p
+
+
+def kappa_batch(t, y, t_build=None):
+    """ Isentropic exponents of many streams, see heat_capacity_batch """
+    c_p = heat_capacity_batch(t, y, t_build)
+    return c_p / (c_p - 8.314)
+
+
+def enthalpy_batch(t, y, t_build=None):
+    """ Molar enthalpies of many streams [MJ/mol], see heat_capacity_batch """
+    t, y, t_build = _batch_input(t, y, t_build)
+    h = 0
+    for j, k in enumerate(substances):
+        h = h + y[:, j] * _substance_property(k, t, _h_polynomial, np.exp, t_build)
+    h /= 1000
+    return h
+
+
+def molar_weight_batch(y):
+    """ Molar weights of many streams [kg/mol], y: mole fractions, array (N x 7) in the order of substances """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    mw = 0
+    for j, k in enumerate(substances):
+        mw = mw + y[:, j] * molar_weights[k]
+    return mw / 1000
+
+
 def calc_beta_psa(k_prod):
     if k_prod == 'H2':
         beta = 0.02
@@ -122,9 +242,12 @@ def calc_alpha_msp(k, k_prod):  # calculate relative permeability alpha(k/k_prod
     return alpha
 
 
+molar_weights = {'CO': 28, 'CO2': 44, 'H2O': 18, 'H2': 2, 'O2': 32, 'N2': 28, 'CH4': 16}  # g/mol
+
+
 def molar_weight(k):
     """ Returns the molar weight of a component or a set of mole fractions"""
-    mw_comp = {'CO': 28, 'CO2': 44, 'H2O': 18, 'H2': 2, 'O2': 32, 'N2': 28, 'CH4': 16}
+    mw_comp = molar_weights
     if k == 'COG':
         k = {'CO': 0.042, 'CO2': 0.012, 'H2': 0.621, 'O2': 0, 'N2': 0.059, 'CH4': 0.225, 'H2O': 0.041}
     elif k == 'B(O)FG':
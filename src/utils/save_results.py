@@ -35,6 +35,7 @@ class ResultManager():
         if type(self.s) == Superstructure:
             if type(self.s.lci) is not None:
                 self.lci = self.s.lci
+            self.s.sync_aliases()  # Full stream table in reduced space
 
         if type(self.s) == LifeCycleInventory:
             self.lci = self.s
@@ -171,7 +172,7 @@ class ResultManager():
         n = 0
         for p in self.lci.processes:
             worksheet3.write(n + 1, 0, p)
-            worksheet3.write(n + 1, 1, clean_value(self.lci.lp.s[p]) * self.lci.scale)
+            worksheet3.write(n + 1, 1, clean_value(self.lci.process_level(p)) * self.lci.scale)
             n += 1
 
         worksheet4 = workbook.add_worksheet('sankey matrix')
@@ -189,8 +190,8 @@ class ResultManager():
         for p in self.lci.processes:
             j = 0
             while j < len(self.lci.intermediate_flows):
-                worksheet4.write(j + 1, k + 1, self.lci.A.iloc[j, k] * clean_value(
-                    self.lci.lp.s[p]) * self.lci.scale)
+                worksheet4.write(j + 1, k + 1, self.lci.A[j, k] * clean_value(
+                    self.lci.process_level(p)) * self.lci.scale)
                 j += 1
             k += 1
 
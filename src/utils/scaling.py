@@ -0,0 +1,149 @@
+import math
+import pyomo.environ as pe
+from pyomo.gdp import Disjunct
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.core.expr.calculus.diff_with_pyomo import reverse_ad
+from pyomo.repn import generate_standard_repn
+from pyomo.common.collections import ComponentMap
+
+"""
+Automatic scaling of variables and constraints for the NLP solver (ipopt option nlp_scaling_method=user-scaling).
+Variables are scaled by their nominal value (current value, else bounds), constraints by their largest
+Jacobian entry after variable scaling (if possible without moving their smallest entry below entry_range). All factors are powers of ten, so that no rounding errors are introduced
+"""
+
+max_magnitude = 1E6  # Larger bounds (e.g. LCI variables, 10**18 / scale) are not used as nominal values
+min_value = 1E-8  # Smaller values are treated as zero, the bounds are used instead
+factor_range = (1E-6, 1E6)  # Limits of all scaling factors
+entry_range = (1E-4, 1E4)  # Range of well scaled Jacobian entries
+
+
+def _inside(component, block):
+    """ True if component belongs to block or one of its sub-blocks """
+    b = component.parent_block()
+    while b is not None:
+        if b is block:
+            return True
+        b = b.parent_block()
+    return False
+
+
+def _power_of_ten(magnitude):
+    factor = 10 ** -round(math.log10(magnitude))
+    return min(max(factor, factor_range[0]), factor_range[1])
+
+
+def jacobian(block):
+    """
+    Returns the nonzero entries of the Jacobian of all active constraints of block (incl. disjuncts)
+    at the current values as list of (constraint, variable, value). Constraints, which cannot be
+    evaluated at the current point (e.g. division by zero), are left out
+    """
+    entries = []
+    for con in block.component_data_objects(pe.Constraint, active=True, descend_into=(pe.Block, Disjunct)):
+        try:
+            repn = generate_standard_repn(con.body, compute_values=True, quadratic=False)
+            if repn.is_linear():
+                row = zip(repn.linear_vars, repn.linear_coefs)
+            else:
+                derivatives = reverse_ad(con.body)
+                row = [(var, derivatives.get(var, 0)) for var in identify_variables(con.body, include_fixed=False)]
+            entries += [(con, var, float(value)) for var, value in row if not var.fixed and value != 0]
+        except (ZeroDivisionError, ValueError, OverflowError):
+            continue
+    return entries
+
+
+def variable_scale(var):
+    """ Scaling factor of a variable from its current value or, if it is zero, its bounds """
+    value = var.value
+    if value is not None and abs(value) > min_value:
+        return _power_of_ten(abs(value))
+    bounds = [abs(b) for b in (var.lb, var.ub) if b is not None and b != 0]
+    if bounds and max(bounds) <= max_magnitude:
+        return _power_of_ten(max(bounds))
+    return 1
+
+
+def scaling_factors(block, entries, exclude=(), outer=None):
+    """
+    Returns the scaling factors of the variables and constraints of block as ComponentMap
+        entries:    Jacobian entries of the model, see jacobian
+        exclude:    sub-blocks, which are scaled separately (e.g. the LCI block of a superstructure)
+        outer:      (optional) factors of variables owned by other blocks, e.g. connectors of the LCI
+    Only components owned by block (and not by one of the excluded blocks) are scaled
+    """
+    if outer is None:
+        outer = ComponentMap()
+    def owned(component):
+        return _inside(component, block) and not any(_inside(component, b) for b in exclude)
+
+    factors = ComponentMap()
+    for con, var, value in entries:
+        if var not in factors and owned(var):
+            factors[var] = variable_scale(var)
+
+    largest = ComponentMap()
+    smallest = ComponentMap()
+    for con, var, value in entries:
+        if owned(con):
+            scaled = abs(value) / factors.get(var, outer.get(var, 1))
+            largest[con] = max(largest.get(con, 0), scaled)
+            smallest[con] = min(smallest.get(con, float('inf')), scaled)
+    for con in largest.keys():
+        factor = _power_of_ten(largest[con])  # About 1 / largest entry
+        if smallest[con] * factor < entry_range[0]:  # Wide row: lift its smallest entry into entry_range
+            lift = 10 ** min(math.ceil(math.log10(entry_range[0] / smallest[con])),
+                             math.floor(math.log10(entry_range[1] / largest[con])))
+            factor = min(max(factor, lift), factor_range[1])
+        factors[con] = factor
+    return factors
+
+
+def no_worse(before, after):
+    """ True if the scaled Jacobian (see jacobian_statistics) has no larger ratio and no more entries outside [1E-4, 1E4] """
+    if before['ratio'] is None or after['ratio'] is None:
+        return True
+    return after['ratio'] <= before['ratio'] and after['outside'] <= before['outside']
+
+
+def apply_scaling(block, factors):
+    """ Writes scaling factors to the suffix block.scaling_factor, which is created if necessary """
+    if block.component('scaling_factor') is None:
+        block.scaling_factor = pe.Suffix(direction=pe.Suffix.EXPORT)
+    for component in factors.keys():
+        block.scaling_factor[component] = factors[component]
+
+
+def jacobian_statistics(entries, factors=None):
+    """
+    Returns condition-related statistics of the Jacobian, optionally after scaling with factors:
+    number of entries, largest and smallest entry, their ratio, entries outside [1E-4, 1E4] and the
+    largest ratio of entries within one constraint
+    """
+    if factors is None:
+        factors = ComponentMap()
+    values = []
+    rows = ComponentMap()
+    for con, var, value in entries:
+        scaled = abs(value) * factors.get(con, 1) / factors.get(var, 1)
+        values.append(scaled)
+        low, high = rows.get(con, (scaled, scaled))
+        rows[con] = (min(low, scaled), max(high, scaled))
+    if not values:
+        return {'constraints': 0, 'nonzeros': 0, 'max': None, 'min': None, 'ratio': None, 'outside': 0,
+                'max_row_ratio': None}
+    return {'constraints': len(rows), 'nonzeros': len(values), 'max': max(values), 'min': min(values),
+            'ratio': max(values) / min(values),
+            'outside': sum(1 for v in values if v > entry_range[1] or v < entry_range[0]),
+            'max_row_ratio': max(high / low for low, high in rows.values())}
+
+
+def statistics_table(before, after):
+    """ Returns the statistics before and after scaling as text table """
+    lines = ['{:<32} {:>14} {:>14}'.format('Jacobian', 'Unscaled', 'Scaled')]
+    for key, label in [('constraints', 'Constraints'), ('nonzeros', 'Nonzeros'), ('max', 'Largest entry'),
+                       ('min', 'Smallest entry'), ('ratio', 'Largest / smallest'),
+                       ('outside', 'Entries outside [1E-4, 1E4]'), ('max_row_ratio', 'Largest ratio in a row')]:
+        lines.append('{:<32} {:>14.4g} {:>14.4g}'.format(label, before[key] or 0, after[key] or 0))
+    return '\n'.join(lines)
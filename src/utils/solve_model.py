@@ -1,7 +1,329 @@
 import pyomo.environ as pe
+import pyomo.gdp as gdp
+import numpy as np
+from scipy.optimize import linprog
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import time
 from utils.save_results import clean_value
 import pyomo.solvers
+from pyomo.solvers.plugins.solvers.persistent_solver import PersistentSolver
+from pyomo.contrib.fbbt.fbbt import fbbt
+from pyomo.common.errors import InfeasibleConstraintException
+from pyutilib.common import ApplicationError
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.core.expr.numeric_expr import LinearExpression, SumExpression
+from pyomo.core.expr.numvalue import native_types
+from pyomo.common.collections import ComponentMap, ComponentSet
+from utils.profiling import profiler
+from utils.scaling import statistics_table
+
+
+def store_solution(model):
+    """ Returns the values of all variables of a model (incl. indicator variables of disjuncts) by name """
+    values = {}
+    for v in model.component_data_objects(pe.Var, descend_into=(pe.Block, gdp.Disjunct)):
+        values[v.name] = v.value
+    return values
+
+
+def load_solution(model, values):
+    """ Sets the values of all (not fixed) variables of a model from store_solution """
+    for v in model.component_data_objects(pe.Var, descend_into=(pe.Block, gdp.Disjunct)):
+        if v.name in values.keys() and values[v.name] is not None and not v.fixed:
+            v.set_value(values[v.name])
+
+
+_enumeration_model = None  # Model of the superstructure in each worker process of solve_enumerate
+
+
+def _init_enumeration_worker(model):
+    global _enumeration_model
+    _enumeration_model = model
+
+
+def _solve_configuration(configuration):
+    """
+    Solves the superstructure for one fixed disjunct configuration (worker of Solver.solve_enumerate)
+    configuration: names of the active disjuncts, one per disjunction
+    """
+    start = time.time()
+    m = _enumeration_model.clone()
+    for d in m.component_data_objects(gdp.Disjunct, descend_into=(pe.Block, gdp.Disjunct)):
+        if d.name in configuration:
+            d.indicator_var.fix(1)
+        else:
+            d.indicator_var.fix(0)
+    pe.TransformationFactory('gdp.fix_disjuncts').apply_to(m)
+
+    try:
+        results = pe.SolverFactory('ipopt').solve(m, load_solutions=False)
+        termination = results.solver.termination_condition
+    except (ValueError, RuntimeError, ApplicationError) as e:  # e.g. evaluation errors, ipopt not found or crashed
+        return {'configuration': configuration, 'objective': None, 'termination': 'error: ' + str(e),
+                'time': time.time() - start, 'solution': None}
+
+    objective = None
+    solution = None
+    if termination in (pe.TerminationCondition.optimal, pe.TerminationCondition.locallyOptimal):
+        m.solutions.load_from(results)
+        objective = pe.value(next(m.component_data_objects(pe.Objective, active=True)))
+        solution = store_solution(m)
+    return {'configuration': configuration, 'objective': objective, 'termination': str(termination),
+            'time': time.time() - start, 'solution': solution}
+
+
+class SolveResult():
+    """
+    Outcome of one solve, which is returned instead of signalling failures by an objective of 0
+        termination:    termination condition of the solver (e.g. 'optimal', 'infeasible', 'error')
+        wall_time:      wall time of the solve [s]
+        iterations:     iteration counts reported by the (sub)solvers, e.g. {'gdpopt': 3}
+        best_bound:     best known lower bound of the (scaled) objective
+        incumbent:      (scaled) objective of the loaded solution
+        max_violation:  largest relative constraint or bound violation of the loaded solution (see check_feasibility)
+        feasible:       True if max_violation is below the tolerance of the feasibility re-check
+        message:        error message, if the solver raised an exception
+        trace:          per iteration telemetry of gdpopt (see GdpTrace)
+        bounds:         report of the bound tightening before the solve (see Solver.tighten_bounds), if any
+        ranking:        all configurations ranked by objective (see Solver.solve_enumerate), if any
+    """
+
+    ok_conditions = ('optimal', 'locallyOptimal', 'globallyOptimal', 'feasible')
+
+    def __init__(self, solver_name):
+        self.solver_name = solver_name
+        self.termination = None
+        self.wall_time = None
+        self.iterations = {}
+        self.best_bound = None
+        self.incumbent = None
+        self.max_violation = None
+        self.feasible = False
+        self.message = ''
+        self.trace = []
+        self.bounds = None
+        self.ranking = None
+
+    @property
+    def ok(self):
+        """ True if the solver terminated regularly and the solution passed the feasibility re-check """
+        return self.termination in self.ok_conditions and self.feasible
+
+    def as_dict(self):
+        """ Plain dict, which can be stored with the sweep results """
+        bounds = None  # Without the original bounds, which hold pyomo components
+        if self.bounds is not None:
+            bounds = {k: self.bounds[k] for k in ('moved', 'pruned', 'skipped', 'excluded', 'infeasible')}
+        return {'solver': self.solver_name, 'termination': self.termination, 'wall_time': self.wall_time,
+                'iterations': dict(self.iterations), 'best_bound': self.best_bound, 'incumbent': self.incumbent,
+                'max_violation': self.max_violation, 'feasible': self.feasible, 'message': self.message,
+                'ok': self.ok, 'trace': list(self.trace), 'bounds': bounds, 'ranking': self.ranking}
+
+    def __repr__(self):
+        return ('SolveResult(' + str(self.solver_name) + ': ' + str(self.termination) + ', z=' + str(self.incumbent)
+                + ', bound=' + str(self.best_bound) + ', feasible=' + str(self.feasible)
+                + ', ' + str(self.wall_time) + ' s)')
+
+
+def _in_selected_disjuncts(component):
+    """ False if component belongs to a disjunct, which is not selected in the current solution """
+    block = component.parent_block()
+    while block is not None:
+        if isinstance(block, gdp.Disjunct) or getattr(block, 'ctype', None) is gdp.Disjunct:
+            if block.indicator_var.value is None or block.indicator_var.value < 0.5:
+                return False
+        block = block.parent_block()
+    return True
+
+
+def _row_magnitude(c):
+    """
+    Returns max(1, |bounds|, largest |term| of the body) of a constraint, so that the violation of rows with
+    large coefficients (e.g. the unscaled LCI) is measured relative to the round-off of their terms
+    """
+    if isinstance(c.body, LinearExpression):
+        terms = [coef * var for coef, var in zip(c.body.linear_coefs, c.body.linear_vars)] + [c.body.constant]
+    elif isinstance(c.body, SumExpression):
+        terms = c.body.args
+    else:
+        terms = [c.body]
+    magnitude = 1
+    for term in terms + [c.lower, c.upper]:
+        value = pe.value(term, exception=False) if term is not None else None
+        if value is not None:
+            magnitude = max(magnitude, abs(value))
+    return magnitude
+
+
+def check_feasibility(model, tol=1E-5):
+    """
+    Evaluates all active constraints (of the selected disjuncts) and variable bounds with the values loaded
+    in model and returns the largest relative violation: constraint violations are divided by max(1, |bounds|,
+    largest |term|) (see _row_magnitude), bound violations by max(1, |bound|).
+    Unset variables in a constraint count as infinite violation
+    """
+    max_violation = 0
+    for c in model.component_data_objects(pe.Constraint, active=True, descend_into=(pe.Block, gdp.Disjunct)):
+        if not _in_selected_disjuncts(c):
+            continue
+        body = pe.value(c.body, exception=False)
+        if body is None:
+            return float('inf')
+        violation = 0
+        if c.has_lb():
+            violation = max(violation, pe.value(c.lower) - body)
+        if c.has_ub():
+            violation = max(violation, body - pe.value(c.upper))
+        if violation > 0:
+            max_violation = max(max_violation, violation / _row_magnitude(c))
+    for v in model.component_data_objects(pe.Var, descend_into=(pe.Block, gdp.Disjunct)):
+        if v.value is None or not _in_selected_disjuncts(v):
+            continue
+        if v.has_lb():
+            max_violation = max(max_violation, (pe.value(v.lb) - v.value) / max(1, abs(pe.value(v.lb))))
+        if v.has_ub():
+            max_violation = max(max_violation, (v.value - pe.value(v.ub)) / max(1, abs(pe.value(v.ub))))
+    return max_violation
+
+
+class GdpTrace():
+    """
+    Collects one entry per NLP subproblem of a GDPopt run via its callbacks:
+        iteration:      LOA master iteration (0: initialization, e.g. set covering)
+        configuration:  names of the selected disjuncts
+        mip_time:       wall time of the master problem [s] (None for initialization subproblems without master)
+        mip_status:     'optimal' or 'infeasible' (master problem)
+        nlp_time:       wall time of the NLP subproblem [s]
+        nlp_status:     'feasible' or 'infeasible' (as judged by GDPopt)
+        nlp_objective:  objective of a feasible NLP subproblem
+        LB, UB:         bounds of GDPopt after the entry
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._start = None
+
+    def callbacks(self):
+        """ Returns the callback arguments for the gdpopt solver """
+        return {'call_before_master_solve': self.before_master,
+                'call_after_master_solve': self.after_master,
+                'call_before_subproblem_solve': self.before_subproblem,
+                'call_after_subproblem_solve': self.after_subproblem,
+                'call_after_subproblem_feasible': self.subproblem_feasible}
+
+    @staticmethod
+    def _configuration(model):
+        return [d.name for d in model.GDPopt_utils.disjunct_list
+                if d.indicator_var.value is not None and d.indicator_var.value > 0.5]
+
+    def _update_bounds(self, solve_data):
+        if self.entries:  # GDPopt updates the bounds after the callbacks of a subproblem
+            self.entries[-1]['LB'] = solve_data.LB
+            self.entries[-1]['UB'] = solve_data.UB
+
+    def before_master(self, model, solve_data):
+        self._update_bounds(solve_data)
+        self.entries.append({'iteration': solve_data.master_iteration, 'configuration': None,
+                             'mip_time': None, 'mip_status': None, 'nlp_time': None, 'nlp_status': None,
+                             'nlp_objective': None, 'LB': solve_data.LB, 'UB': solve_data.UB})
+        self._start = time.perf_counter()
+
+    def after_master(self, model, solve_data):
+        entry = self.entries[-1]
+        entry['mip_time'] = time.perf_counter() - self._start
+        infeasible = solve_data.LB == float('inf') or solve_data.UB == float('-inf')  # Set by GDPopt (min/max)
+        entry['mip_status'] = 'infeasible' if infeasible else 'optimal'
+        entry['configuration'] = self._configuration(model)
+        entry['LB'] = solve_data.LB
+        entry['UB'] = solve_data.UB
+
+    def before_subproblem(self, model, solve_data):
+        if not self.entries or self.entries[-1]['nlp_status'] is not None or self.entries[-1]['mip_time'] is None:
+            self._update_bounds(solve_data)  # Subproblem without master problem, e.g. during initialization
+            self.entries.append({'iteration': solve_data.master_iteration,
+                                 'configuration': self._configuration(model),
+                                 'mip_time': None, 'mip_status': None, 'nlp_time': None, 'nlp_status': None,
+                                 'nlp_objective': None, 'LB': solve_data.LB, 'UB': solve_data.UB})
+        self._start = time.perf_counter()
+
+    def after_subproblem(self, model, solve_data):
+        self.entries[-1]['nlp_time'] = time.perf_counter() - self._start
+        self.entries[-1]['nlp_status'] = 'infeasible'
+
+    def subproblem_feasible(self, model, solve_data):
+        self.entries[-1]['nlp_status'] = 'feasible'
+        objective = next(model.component_data_objects(pe.Objective, active=True))
+        self.entries[-1]['nlp_objective'] = pe.value(objective)
+
+    def finish(self, results):
+        """ Sets the final bounds of the last entry from the gdpopt results """
+        if self.entries and results is not None:
+            self.entries[-1]['LB'] = results.problem.lower_bound
+            self.entries[-1]['UB'] = results.problem.upper_bound
+        return self.entries
+
+
+@profiler.profile('solver.check_feasibility')
+def _read_results(record, results, model, tol):
+    """ Copies termination, bounds and iteration counts of pyomo solver results into record and re-checks the solution """
+    if results is not None:
+        record.termination = str(results.solver.termination_condition)
+        lower_bound = results.problem.lower_bound
+        if lower_bound is not None and abs(lower_bound) != float('inf'):
+            record.best_bound = float(lower_bound)
+        iterations = getattr(results.solver, 'iterations', None)
+        if iterations is not None and not isinstance(iterations, str):
+            try:
+                record.iterations[record.solver_name] = int(iterations)
+            except (TypeError, ValueError):
+                pass
+    objective = next(model.component_data_objects(pe.Objective, active=True), None)
+    if objective is not None:
+        record.incumbent = pe.value(objective, exception=False)
+    record.max_violation = check_feasibility(model, tol)
+    record.feasible = record.incumbent is not None and record.max_violation <= tol
+    return record
+
+
+def _same_bounds(a, b, tol):
+    """ True if two (lb, ub) pairs differ by at most tol (relative for large bounds), None is unbounded """
+    for x, y in zip(a, b):
+        if x is None or y is None:
+            if x is not y:
+                return False
+        elif abs(x - y) > tol * max(1, abs(x)):
+            return False
+    return True
+
+
+def _has_linear_expression(expr):
+    """ True if expr contains a LinearExpression (e.g. the LCI rows), which fbbt of Pyomo 5.7.1 cannot propagate """
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, LinearExpression):
+            return True
+        if type(node) not in native_types and node.is_expression_type():
+            stack.extend(node.args)
+    return False
+
+
+def _propagate(con):
+    """
+    Tightens the bounds of the variables of one constraint (fbbt). Returns False if fbbt reports the constraint
+    infeasible, the bounds of its variables are then left unchanged
+    """
+    variables = list(identify_variables(con.body, include_fixed=False))
+    bounds = [(var.lb, var.ub) for var in variables]
+    try:
+        fbbt(con)
+    except InfeasibleConstraintException:
+        for var, (lb, ub) in zip(variables, bounds):
+            var.setlb(lb)
+            var.setub(ub)
+        return False
+    return True
 
 
 class Solver():
@@ -10,52 +332,281 @@ class Solver():
     def __init__(self):
         self.lci = None
         self.lci_model = None
+        self.persistent_solvers = {}  # Solver instances, which keep their model loaded between solves
+        self.persistent_models = {}  # Model loaded in each persistent solver
+
+
+    @profiler.profile('solver.tighten_bounds')
+    def tighten_bounds(self, s, rounds=3, tol=1E-6):
+        """
+        Feasibility-based bound tightening of the flowsheet variables of superstructure s.
+        Each round propagates the global constraints (fbbt), then the constraints of every active disjunct
+        and lifts the union of the disjunct bounds of each disjunction to the global bounds.
+        Tighter bounds give smaller big-M values and tighter OA cuts in the MIP master.
+        Constraints built as LinearExpression (the rows of the LCI) are excluded: fbbt (Pyomo 5.7.1) does not
+        support this expression type. The LCI variables are only tightened through the connectors.
+        fbbt (Pyomo 5.7.1) reports some nonlinear constraints infeasible, which are not (e.g. powers with a variable
+        exponent, the sigmoid of the blended thermo model), so these constraints are skipped. Only a linear
+        constraint found infeasible prunes a disjunct or makes the whole model infeasible.
+        The bounds are written to the model and derived from the current process fixings and caps of the LCI.
+        They stay valid if impacts are changed with set_impact (impacts only appear in the objective) or further
+        processes are deactivated, but not if processes are activated or caps are changed: these raise a Warning
+        in the LCI until restore_bounds is called with the report.
+        rounds: maximum number of rounds, stops early if no bound moved by more than tol
+        Returns a report: the moved bounds {name: ((old lb, old ub), (new lb, new ub))}, the pruned
+        disjuncts, the skipped and excluded constraints, 'infeasible' (if so, all bounds are left unchanged) and the original
+        bounds, which can be restored with restore_bounds
+        """
+        variables = list(s.model.component_data_objects(pe.Var, descend_into=(pe.Block, gdp.Disjunct)))
+        original = ComponentMap((var, (var.lb, var.ub)) for var in variables)
+        report = {'moved': {}, 'pruned': [], 'skipped': [], 'excluded': [], 'infeasible': False,
+                  'original': original}
+        skipped = ComponentSet()
+        excluded = ComponentSet()
+
+        def propagate(constraints):
+            """ Propagates constraints, returns the first linear constraint found infeasible (None if there is none) """
+            for con in constraints:
+                if con not in excluded and _has_linear_expression(con.body):
+                    excluded.add(con)
+                if con in skipped or con in excluded or _propagate(con):
+                    continue
+                if con.body.polynomial_degree() in (0, 1):
+                    return con
+                skipped.add(con)
+            return None
+
+        def widest(bounds):
+            return (min(b[0] for b in bounds), max(b[1] for b in bounds))
 
+        def finite(var):
+            return (float('-inf') if var.lb is None else var.lb, float('inf') if var.ub is None else var.ub)
 
-    def solve_gdp(self, s):
+        global_constraints = list(s.model.component_data_objects(pe.Constraint, active=True, descend_into=pe.Block))
+        for _ in range(rounds):
+            before = [(var.lb, var.ub) for var in variables]
+            infeasible = propagate(global_constraints)
+            for name in s.disjunctions.keys():
+                if infeasible is not None:
+                    break
+                local = []
+                for d in [d for d in s.disjunctions[name].disjuncts if d.active]:
+                    constraints = list(d.component_data_objects(pe.Constraint, active=True, descend_into=pe.Block))
+                    scope = ComponentSet(var for con in constraints
+                                         for var in identify_variables(con.body, include_fixed=False))
+                    global_bounds = ComponentMap((var, (var.lb, var.ub)) for var in scope)
+                    if propagate(constraints) is None:
+                        local.append(ComponentMap((var, finite(var)) for var in scope))
+                    else:
+                        d.deactivate()
+                        report['pruned'].append(d.name)
+                    for var, (lb, ub) in global_bounds.items():
+                        var.setlb(lb)
+                        var.setub(ub)
+                if not local:
+                    infeasible = s.disjunctions[name]
+                    break
+                for var in ComponentSet(var for bounds in local for var in bounds.keys()):
+                    glob = finite(var)
+                    lb, ub = widest([bounds.get(var, glob) for bounds in local])
+                    if lb > glob[0] + tol:
+                        var.setlb(lb)
+                    if ub < glob[1] - tol:
+                        var.setub(ub)
+            if infeasible is not None:
+                report['infeasible'] = True
+                print('Bound tightening detected an infeasible constraint, bounds are left unchanged:', infeasible.name)
+                for var in variables:
+                    var.setlb(original[var][0])
+                    var.setub(original[var][1])
+                for name in report['pruned']:
+                    s.disjuncts[name].activate()
+                report['pruned'] = []
+                break
+            after = [(var.lb, var.ub) for var in variables]
+            if all(_same_bounds(b, a, tol) for b, a in zip(before, after)):
+                break
+
+        report['skipped'] = [con.name for con in skipped]
+        report['excluded'] = [con.name for con in excluded]
+        if s.lci is not None and not report['infeasible']:
+            s.lci.tightened = True
+        for var in variables:
+            if not _same_bounds(original[var], (var.lb, var.ub), tol):
+                report['moved'][var.name] = (original[var], (var.lb, var.ub))
+        print('Bound tightening:', len(report['moved']), 'of', len(variables), 'variable bounds moved,',
+              len(report['pruned']), 'disjuncts pruned,', len(report['skipped']), 'constraints skipped,',
+              len(report['excluded']), 'LinearExpression constraints excluded')
+        return report
+
+    def restore_bounds(self, s, report):
+        """
+        Restores the bounds and disjuncts before tighten_bounds, must be called before processes are activated
+        or caps are changed. report: of the first tighten_bounds call since the last restore
+        """
+        for var, (lb, ub) in report['original'].items():
+            var.setlb(lb)
+            var.setub(ub)
+        for name in report['pruned']:
+            s.disjuncts[name].activate()
+        if s.lci is not None:
+            s.lci.tightened = False
+
+    @profiler.profile('solver.solve_gdp')
+    def solve_gdp(self, s, warm_start=None, tol=1E-5, trace=True, initialize=False, scaling=False, tighten=False):
         """
         Solves a gdp model without transformation, using gdpopt
         s: object of class superstructure
+        warm_start: (optional) values from store_solution, e.g. of a neighbouring sweep point, or True to
+        use the current values of s.model. Indicator and continuous variables are initialized with these
+        values and LOA starts from this disjunct configuration instead of set covering
+        tol: relative tolerance of the feasibility re-check of the returned solution (see check_feasibility)
+        trace: record configuration, timing, status and bounds of every NLP/MIP solve in result.trace
+        initialize: start from a sequential-modular initialization of the flowsheet (see Superstructure.initialize)
+        instead of the current values of s.model. Not used with warm_start
+        scaling: scale variables and constraints of the NLPs automatically (see Superstructure.set_scaling),
+        the Jacobian statistics before and after scaling are printed. Not used if it makes the Jacobian worse
+        tighten: tighten the variable bounds before solving (see tighten_bounds). The bounds stay in the model,
+        the report is returned in result.bounds and is required by restore_bounds
+        Returns a SolveResult. Solver errors (e.g. ipopt failures) are recorded in it instead of raised
         """
 
         self.lci = s.lci
         self.lci_model = s.model.utilization
 
+        bounds = self.tighten_bounds(s) if tighten else None
+
+        init_strategy = 'set_covering'
+        if warm_start is not None and warm_start is not False:
+            if warm_start is not True:
+                load_solution(s.model, warm_start)
+            if all(s.disjuncts[d].indicator_var.value is not None for d in s.disjuncts.keys()):
+                for d in s.disjuncts.keys():
+                    s.disjuncts[d].indicator_var.set_value(round(s.disjuncts[d].indicator_var.value))
+                init_strategy = 'fix_disjuncts'
+        elif initialize:
+            s.initialize()
+
+        nlp_solver_args = {}
+        if scaling:
+            scaling_report = s.set_scaling()
+            print(statistics_table(scaling_report['before'], scaling_report['after']))
+            if scaling_report['applied']:
+                nlp_solver_args['options'] = {'nlp_scaling_method': 'user-scaling'}
+            else:
+                print('Scaling is not used, it makes the Jacobian worse')
+
         s.solver_used = 'gdpopt (ipot/glpk)' #'gdpopt (ipot/cbc)'
         # s.solver_used = 'gdpopt (baron/gurobi)'
+        record = SolveResult('gdpopt')
+        record.bounds = bounds
+        results = None
+        gdp_trace = GdpTrace()
+        callbacks = gdp_trace.callbacks() if trace else {}
         start = time.time()
         tee = True
-        pe.SolverFactory('gdpopt').solve(s.model,
-                                         tee=tee,
-                                         # time_limit=1000,
-                                         nlp_solver='ipopt',
-                                         # nlp_solver_args={'tol': 1E-5},
-                                         constraint_tolerance=1E-10,
-                                         mip_solver='glpk',
-                                         #mip_solver='cbc',
-                                         init_strategy='set_covering',
-                                         # mip_solver = 'gurobi',
-                                         # mip_solver_args={'timelimit': 1000}
-                                         )
+        try:
+            results = pe.SolverFactory('gdpopt').solve(s.model,
+                                                       tee=tee,
+                                                       # time_limit=1000,
+                                                       nlp_solver='ipopt',
+                                                       # nlp_solver_args={'tol': 1E-5},
+                                                       nlp_solver_args=nlp_solver_args,
+                                                       constraint_tolerance=1E-10,
+                                                       mip_solver='glpk',
+                                                       #mip_solver='cbc',
+                                                       init_strategy=init_strategy,
+                                                       # mip_solver = 'gurobi',
+                                                       # mip_solver_args={'timelimit': 1000}
+                                                       **callbacks)
+        except (ValueError, RuntimeError, ApplicationError) as e:
+            record.termination = 'error'
+            record.message = str(e)
 
 
         # pe.SolverFactory('gdpbb').solve(s.model, solver='ipopt', tee=tee)
         end = time.time()
         s.solver_timer = end - start
 
-    def solve_lp(self, lci, solver_name):
+        record.wall_time = s.solver_timer
+        s.sync_aliases()
+        _read_results(record, results, s.model, tol)
+        if trace:
+            record.trace = gdp_trace.finish(results)
+            record.iterations['nlp'] = sum(1 for entry in record.trace if entry['nlp_time'] is not None)
+            record.iterations['mip'] = sum(1 for entry in record.trace if entry['mip_time'] is not None)
+        return record
+
+    @profiler.profile('solver.solve_enumerate')
+    def solve_enumerate(self, s, processes=None, tol=1E-5):
+        """
+        Solves a gdp model by enumerating all combinations of the disjunctions of s (one disjunct each).
+        Each fixed-topology NLP is solved with ipopt in its own worker process.
+        The best solution is loaded into s.model
+        s: object of class superstructure
+        processes: number of worker processes, default: all cores
+        tol: relative tolerance of the feasibility re-check of the best solution (see check_feasibility)
+        Returns a SolveResult, all configurations ranked by objective (failed configurations last) in
+        result.ranking. If no configuration is feasible, result.ok is False
+        """
+        self.lci = s.lci
+        self.lci_model = s.model.utilization
+        record = SolveResult('enumeration')
+
+        s.solver_used = 'enumeration (ipopt)'
+        start = time.time()
+
+        configurations = list(itertools.product(
+            *[[d.name for d in s.disjunction_sets[k]] for k in s.disjunction_sets.keys()]))
+
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_enumeration_worker,
+                                 initargs=(s.model,)) as pool:
+            table = list(pool.map(_solve_configuration, configurations))
+
+        table.sort(key=lambda r: (r['objective'] is None, r['objective']))
+
+        record.iterations['nlp'] = len(table)
+        record.ranking = []
+        for r in table:
+            record.ranking.append({'configuration': r['configuration'], 'objective': r['objective'],
+                                   'termination': r['termination'], 'time': r['time']})
+
+        if table[0]['objective'] is None:
+            record.termination = 'infeasible'
+            record.message = 'No feasible disjunct configuration found'
+        else:
+            load_solution(s.model, table[0]['solution'])
+            for d in s.disjuncts.keys():
+                s.disjuncts[d].indicator_var.set_value(1 if d in table[0]['configuration'] else 0)
+            record.termination = table[0]['termination']
+            _read_results(record, None, s.model, tol)
+
+        end = time.time()
+        s.solver_timer = end - start
+        record.wall_time = s.solver_timer
+        return record
+
+    @profiler.profile('solver.solve_lp')
+    def solve_lp(self, lci, solver_name, persistent=False, tol=1E-5):
         """
         Solves linear tcm model
+        persistent: keep the model loaded in a persistent solver, e.g. 'gurobi_persistent'
+        (see solve_lp_persistent)
+        tol: relative tolerance of the feasibility re-check of the returned solution (see check_feasibility)
+        Returns a SolveResult
         """
         self.lci = lci
         self.lci_model = lci.lp
+        record = SolveResult(solver_name)
         start = time.time()
 
-        if solver_name == 'glpk':
-            pe.SolverFactory('glpk').solve(lci.model, tee=True, timelimit=1000)
+        if persistent:
+            results = self.solve_lp_persistent(lci, solver_name)
+        elif solver_name == 'glpk':
+            results = pe.SolverFactory('glpk').solve(lci.model, tee=True, timelimit=1000)
             lci.solver_used = 'glpk'
         elif solver_name == 'gurobi':
-            pe.SolverFactory('gurobi').solve(lci.model, tee=True)  # Wie gebe ich gurobi ein Zeitlimit vor?
+            results = pe.SolverFactory('gurobi').solve(lci.model, tee=True)  # Wie gebe ich gurobi ein Zeitlimit vor?
             lci.solver_used = 'gurobi'
         else:
             raise SystemError('Unknown LP solver')
@@ -66,3 +617,132 @@ class Solver():
 
         end = time.time()
         lci.solver_timer = end - start
+
+        record.wall_time = lci.solver_timer
+        _read_results(record, results, lci.model, tol)
+        return record
+
+    def solve_lp_persistent(self, lci, solver_name):
+        """
+        Solves linear tcm model with a persistent solver, that is created once per Solver object.
+        Re-solves of the same model only push changed process bounds (deactivate_process, set_process_cap)
+        with update_var (the model is loaded again, if undo_presolve rebuilt the demand constraints) and, if impacts changed (set_impact), the objective with set_objective, so that the
+        solver can warm start from the previous basis. The impacts only appear in the objective for this reason.
+        With Pyomo 5.7.1 (environment.yml) the persistent interfaces are 'gurobi_persistent', 'cplex_persistent'
+        and 'xpress_persistent', which all require a commercial solver. Free persistent solvers (appsi,
+        e.g. 'appsi_highs') are not available in this Pyomo version.
+        Returns the pyomo solver results
+        """
+        if solver_name not in self.persistent_solvers.keys():
+            opt = pe.SolverFactory(solver_name)
+            if not isinstance(opt, PersistentSolver):
+                raise ValueError(solver_name + ' is not a persistent solver')
+            self.persistent_solvers[solver_name] = opt
+        opt = self.persistent_solvers[solver_name]
+
+        if self.persistent_models.get(solver_name) is not lci.model or lci.changed_constraints:
+            opt.set_instance(lci.model)
+            self.persistent_models[solver_name] = lci.model
+        else:
+            for process_name in lci.changed_processes:
+                opt.update_var(lci.lp.s[process_name])
+            if lci.changed_impacts:
+                opt.set_objective(lci.lp.objective)
+        results = opt.solve(tee=True, load_solutions=True)
+
+        lci.changed_processes.clear()
+        lci.changed_impacts = False
+        lci.changed_constraints = False
+        lci.solver_used = solver_name + ' (persistent)'
+        return results
+
+    @profiler.profile('solver.solve_matrix')
+    def solve_matrix(self, lci):
+        """
+        Solves the linear tcm model directly from the arrays of lci with HiGHS (scipy >= 1.6),
+        without building pyomo expressions or writing an lp file.
+        Returns the scaling vector s, the intermediate flows y, the (scaled) objective value and the number
+        of simplex iterations
+        """
+        self.lci = lci
+        start = time.time()
+
+        lp = lci.matrix_form()
+        res = linprog(lp['c'], A_ub=lp['A_ub'], b_ub=lp['b_ub'], A_eq=lp['A_eq'], b_eq=lp['b_eq'],
+                      bounds=lp['bounds'], method='highs')
+
+        end = time.time()
+        lci.solver_used = 'highs (matrix)'
+        lci.solver_timer = end - start
+
+        if res.status != 0:
+            raise ValueError('Matrix tcm could not be solved: ' + res.message)
+
+        s = np.zeros(len(lci.processes))  # Map the (presolved) solution back to all processes
+        s[lp['columns']] = res.x * lp['col_scale']  # Unscaled, if the inventory is equilibrated
+        connect = np.zeros(len(lci.intermediate_flows))
+        values = lci.connector_values()
+        for u, flow in enumerate(lci.intermediate_flows):
+            if flow in values.keys():
+                connect[u] = values[flow]
+        y = lci.A.dot(s) + connect
+        objective = res.fun + lp['constant']
+
+        if lci.lp is not None:  # Load solution into the pyomo lp, e.g. for ResultManager
+            lci.load_solution(s, y)
+
+        return {'s': s, 'y': y, 'objective': objective, 'iterations': int(res.nit)}
+
+    @profiler.profile('solver.solve_parametric')
+    def solve_parametric(self, lci, process_name, lower, upper, solver_name='matrix', tol=1E-7):
+        """
+        Exact parametric solution of the tcm over the impact of one process (e.g. 'Electricity, user-defined').
+        The optimal objective z(x) is piecewise linear and concave in the impact x with slope s(x) of that process.
+        Breakpoints are located by intersecting the lines of neighbouring solutions (Eisner-Severance),
+        which needs two solves per breakpoint instead of a dense sampling of [lower, upper].
+        Returns the breakpoints (incl. lower and upper) in the format of the sweep results,
+        {n: {'x': impact, 'z': objective, 's': scaling vector}}
+        solver_name: 'matrix' (HiGHS via solve_matrix) or an lp solver for solve_lp, e.g. 'glpk'
+        """
+        j = lci.processes.index(process_name)
+        impact = lci.b[j]
+
+        def solve_at(x):
+            lci.set_impact(process_name, x)
+            if solver_name == 'matrix':
+                sol = self.solve_matrix(lci)
+                z = sol['objective']
+                s = sol['s']
+            else:
+                record = self.solve_lp(lci, solver_name)
+                if not record.ok:
+                    raise ValueError('Tcm could not be solved at ' + str(x) + ': ' + repr(record))
+                z = pe.value(lci.objective)
+                s = lci.solution()[0]
+            return {'x': x, 'z': z, 'slope': s[j], 's': s}
+
+        def refine(a, b):
+            """ Returns all breakpoints strictly between the solutions a and b """
+            if abs(a['slope'] - b['slope']) <= tol * max(1, abs(a['slope'])):
+                return []  # a and b lie on the same linear piece
+            x = (b['z'] - a['z'] + a['slope'] * a['x'] - b['slope'] * b['x']) / (a['slope'] - b['slope'])
+            if x <= a['x'] or x >= b['x']:
+                return []  # numerical noise, no breakpoint in between
+            mid = solve_at(x)
+            line = a['z'] + a['slope'] * (x - a['x'])
+            if abs(mid['z'] - line) <= tol * max(1, abs(line)):
+                return [mid]  # Both lines are optimal at x
+            return refine(a, mid) + [mid] + refine(mid, b)
+
+        try:
+            first = solve_at(lower)
+            last = solve_at(upper)
+            points = [first] + refine(first, last) + [last]
+        finally:
+            lci.set_impact(process_name, impact)
+
+        curve = {}
+        for n, point in enumerate(points):
+            curve[n] = {'x': point['x'], 'z': point['z'] * lci.scale,
+                        's': dict(zip(lci.processes, point['s'] * lci.scale))}
+        return curve
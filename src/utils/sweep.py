@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import Queue, cpu_count
+from queue import Empty
+import hashlib
+import os
+import pickle
+
+
+_models = None  # Models of the current worker process, built once by the model factory
+_solve_point = None
+_finished = None  # Queue, to which workers send each solved point (n, results)
+
+
+def _init_worker(model_factory, solve_point, finished):
+    global _models, _solve_point, _finished
+    _models = model_factory()
+    _solve_point = solve_point
+    _finished = finished
+
+
+def _run_block(block):
+    """ Solves neighbouring points in order, so that each point can start from the previous one """
+    for n, x in block:
+        _finished.put((n, _solve_point(_models, x)))
+
+
+def _blocks(todo, size):
+    """ Splits the points into contiguous blocks of (at most) size points """
+    return [todo[k:k + size] for k in range(0, len(todo), size)]
+
+
+def file_hash(filenames):
+    """ Returns a hash of the content of files, e.g. of the inventory and the model sources of a sweep """
+    h = hashlib.sha256()
+    for filename in sorted(filenames):
+        h.update(filename.encode())
+        with open(filename, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def settings_hash(settings):
+    """ Returns a hash of the sweep settings (dict), which is stored in the header record of a journal """
+    return hashlib.sha256(repr(sorted(settings.items())).encode()).hexdigest()
+
+
+def journal_header(filename):
+    """ Returns the settings hash in the header record of a journal, None for journals without header """
+    with open(filename, 'rb') as journal:
+        return pickle.load(journal).get('settings')
+
+
+def load_journal(filename):
+    """
+    Returns the points stored in a sweep journal as {n: {'x': x, 'results': ...}}.
+    An incomplete last record (e.g. job killed while writing) is ignored and cut off the file
+    """
+    records = {}
+    if not os.path.isfile(filename):
+        return records
+    valid_size = 0
+    with open(filename, 'rb') as journal:
+        while True:
+            try:
+                record = pickle.load(journal)
+            except (EOFError, pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                break
+            if 'n' in record.keys():  # Not the header
+                records[record['n']] = record
+            valid_size = journal.tell()
+    if valid_size < os.path.getsize(filename):
+        with open(filename, 'r+b') as journal:
+            journal.truncate(valid_size)
+    return records
+
+
+def journal_results(filename):
+    """ Returns the results stored in a sweep journal in the format of run_sweep, e.g. {'tcm': {...}, 'gdp': {...}} """
+    results = {}
+    records = load_journal(filename)
+    for n in sorted(records.keys()):
+        for key in records[n]['results'].keys():
+            if key not in results.keys():
+                results[key] = {}
+            results[key][n] = records[n]['results'][key]
+    return results
+
+
+def run_sweep(points, model_factory, solve_point, processes=None, chunksize=None, journal=None, settings=None):
+    """
+    Solves independent scenario points in a process pool
+        points:         list of scenario points, e.g. electricity impacts
+        model_factory:  function without arguments, which builds (or loads) the models of a worker once
+        solve_point:    function (models, x), which returns the results of one point as dict, e.g. {'tcm': ..., 'gdp': ...}
+        processes:      number of worker processes, default: all cores. processes=1 solves in this process
+        chunksize:      number of neighbouring points solved in order by one worker (warm start from the previous
+                        point), default: the points are split into one contiguous block per worker
+        journal:        (optional) file, to which each finished point is appended immediately.
+                        Points found in the journal are not solved again, so that a killed sweep can be resumed
+        settings:       (optional) dict of everything else, which changes the results (e.g. solver, thermo model,
+                        hash of the inventory, see file_hash). Its hash is stored in the header of a new journal.
+                        A journal written with other settings is not resumed (ValueError)
+    Both functions must be defined at module level, so that they can be sent to the workers.
+    If a worker raises or is killed (e.g. out of memory, solver crash), the points of the other workers are
+    still collected before the error is raised, the unfinished points can be resumed from the journal.
+    Returns the results ordered by point, e.g. {'tcm': {0: ..., 1: ...}, 'gdp': {0: ..., 1: ...}}
+    """
+    results = {}
+
+    def collect(n, r):
+        for key in r.keys():
+            if key not in results.keys():
+                results[key] = {}
+            results[key][n] = r[key]
+
+    todo = list(enumerate(points))
+    journal_file = None
+    if journal is not None:
+        done = load_journal(journal)
+        new = not os.path.isfile(journal) or os.path.getsize(journal) == 0
+        if settings is None:
+            settings = {}
+        if not new and journal_header(journal) != settings_hash(settings):
+            raise ValueError('Journal ' + journal + ' was written with other sweep settings, '
+                                                    'delete it to start the sweep again')
+        for n in done.keys():
+            if n < len(points) and done[n]['x'] == points[n]:
+                collect(n, done[n]['results'])
+        todo = [(n, x) for n, x in todo if not (n in done.keys() and done[n]['x'] == x)]
+        print('Journal', journal + ':', len(points) - len(todo), 'of', len(points), 'points already solved')
+        journal_file = open(journal, 'ab')
+        if new:
+            pickle.dump({'settings': settings_hash(settings)}, journal_file, pickle.HIGHEST_PROTOCOL)
+
+    def finish(n, r):
+        collect(n, r)
+        if journal_file is not None:
+            pickle.dump({'n': n, 'x': points[n], 'results': r}, journal_file, pickle.HIGHEST_PROTOCOL)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        print('Point solved', n + 1, 'of', len(points))
+
+    try:
+        if processes == 1:
+            if len(todo) > 0:
+                models = model_factory()
+                for n, x in todo:
+                    finish(n, solve_point(models, x))
+        elif len(todo) > 0:
+            if chunksize is None:
+                chunksize = -(-len(todo) // (processes or cpu_count()))
+            finished = Queue()
+            blocks = _blocks(todo, chunksize)
+            with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                     initargs=(model_factory, solve_point, finished)) as pool:
+                futures = [pool.submit(_run_block, block) for block in blocks]
+                received = 0
+                while True:  # Points are journaled as they finish, not per block
+                    try:
+                        n, r = finished.get(timeout=1)
+                    except Empty:
+                        # Done if all blocks ended (a killed worker ends all of them) and no point is on its way
+                        if all(f.done() for f in futures) and received >= sum(
+                                len(block) for block, f in zip(blocks, futures) if f.exception() is None):
+                            break
+                        continue
+                    finish(n, r)
+                    received += 1
+            try:
+                for f in futures:
+                    f.result()  # Raises the error of a failed block
+            except BrokenProcessPool as e:
+                raise RuntimeError('A sweep worker was terminated (e.g. out of memory or solver crash), '
+                                   'run the sweep again with the journal to resume the unfinished points') from e
+    finally:
+        if journal_file is not None:
+            journal_file.close()
+
+    for key in results.keys():
+        results[key] = dict(sorted(results[key].items()))
+    return results
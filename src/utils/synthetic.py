@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+from scipy import sparse
+from superstructure import Superstructure
+from utils.properties import molar_weight
+from utils.utils import sum_rule
+
+
+connector_flows = ['Mill gas COG [kg]', 'Hydrogen (H2) [kg]', 'Electricity [MJ]', 'Heat [MJ]']
+
+
+def synthetic_inventory(n_flows, n_processes=None, n_products=None, density=0.05, connectors=None, seed=0):
+    """
+    Generates a feasible random inventory with the structure of the technology matrix:
+        n_flows:        number of intermediate flows (rows of A), incl. connector flows
+        n_processes:    number of processes (columns of A), at least one producer per flow. Additional processes
+                        are alternative routes for random flows, default: 2 * n_flows
+        n_products:     number of flows with production capacity (p > 0), default: n_flows / 10
+        density:        probability of a process consuming a given upstream flow
+        connectors:     names of flows, which can be connected to a superstructure (see connector_flows).
+                        Each connector flow gets a producer and a disposal process, so that any connector
+                        value is feasible
+        seed:           seed of the random numbers
+    Every flow u is produced by process u, which only consumes flows v > u. The inventory is therefore
+    triangular and every demand can be met. Returns the inventory as dict (see utils.inventory_cache)
+    """
+    if connectors is None:
+        connectors = []
+    if n_processes is None:
+        n_processes = 2 * n_flows
+    if n_products is None:
+        n_products = max(1, n_flows // 10)
+    m = n_flows
+    n = max(n_processes, m + len(connectors))
+    if len(connectors) >= m or n_products > m - len(connectors):
+        raise ValueError('Too many connectors or products for ' + str(m) + ' flows')
+
+    random = np.random.RandomState(seed)
+
+    flows = ['Flow ' + str(u + 1) + ' [kg]' for u in range(m - len(connectors))] + list(connectors)
+    processes = []
+    rows, cols, data = [], [], []
+
+    def add_process(name, u_prod):
+        j = len(processes)
+        processes.append(name)
+        rows.append(u_prod)
+        cols.append(j)
+        data.append(1.0)
+        upstream = np.arange(u_prod + 1, m)
+        consumed = upstream[random.rand(len(upstream)) < density]
+        rows.extend(consumed.tolist())
+        cols.extend([j] * len(consumed))
+        data.extend((-random.uniform(0.05, 1.0, len(consumed))).tolist())
+
+    for u in range(m):
+        add_process('Production of ' + flows[u], u)
+    for u in range(m - len(connectors), m):
+        j = len(processes)
+        processes.append('Disposal of ' + flows[u])
+        rows.append(u)
+        cols.append(j)
+        data.append(-1.0)
+    k = 1
+    while len(processes) < n:
+        add_process('Alternative route ' + str(k), random.randint(0, m - len(connectors)))
+        k += 1
+
+    A = sparse.csr_matrix((data, (rows, cols)), shape=(m, n))
+
+    p = [0.0] * m
+    for u in random.choice(m - len(connectors), n_products, replace=False):
+        p[u] = float(random.uniform(1, 100)) * 1E9  # kg, as in the inventory
+    b = random.uniform(0.1, 2.0, n).tolist()  # kg CO2-eq per unit of process
+    v = [float(random.uniform(0, 1)) if p[u] > 0 else 0.0 for u in range(m)]  # End-of-life emissions
+
+    return {'A': A, 'p': p, 'b': b, 'v': v, 'processes': processes, 'intermediate_flows': flows}
+
+
+def write_inventory_excel(filename, inventory, sheetname='A-Matrix', sheetname2='End of life'):
+    """
+    Writes an inventory (see synthetic_inventory) in the sheet layout of LifeCycleInventory.parse_excel:
+        sheetname:  process names in row 2, flows, production capacities and A from row 14,
+                    elementary flows b one row below A
+        sheetname2: end-of-life emissions v in column 11
+    Rows without content are labelled in the first column, so that no row is skipped when reading
+    """
+    A = sparse.csr_matrix(inventory['A']).toarray()
+    m, n = A.shape
+
+    sheet = np.full((14 + m + 2, 2 + n), None, dtype=object)
+    sheet[:, 0] = '-'
+    sheet[2, 0] = 'Process'
+    sheet[2, 2:] = inventory['processes']
+    sheet[14:14 + m, 0] = inventory['intermediate_flows']
+    sheet[14:14 + m, 1] = inventory['p']
+    sheet[14:14 + m, 2:] = A
+    sheet[14 + m, 0] = 'Elementary flows'
+    sheet[14 + m + 1, 0] = 'GWP [kg CO2-eq]'
+    sheet[14 + m + 1, 2:] = inventory['b']
+
+    endoflife = np.full((m, 12), None, dtype=object)
+    endoflife[:, 0] = inventory['intermediate_flows']
+    endoflife[:, 11] = inventory['v']
+
+    with pd.ExcelWriter(filename) as writer:
+        pd.DataFrame(sheet, columns=['Column ' + str(k) for k in range(2 + n)]).to_excel(
+            writer, sheet_name=sheetname, index=False)
+        pd.DataFrame(endoflife, columns=['Column ' + str(k) for k in range(12)]).to_excel(
+            writer, sheet_name=sheetname2, index=False)
+
+
+def synthetic_superstructure(n_trains, scale=1000000000):
+    """
+    Builds a flowsheet of n_trains parallel COG trains from the unit library, each with a compressor,
+    a disjunction between PSA and membrane for hydrogen and a heat exchanger on the off-gas.
+    The flowsheet is connected to the flows in connector_flows of an inventory (see synthetic_inventory)
+    via s.model.connect_lp. Disjunctions are created by import_synthetic_lci
+    """
+    s = Superstructure('Synthetic ' + str(n_trains))
+
+    k = 1
+    while k <= n_trains:
+        i = 100 * k
+        s.initial_stream(i + 1, 0, 300, 1, 'COG')
+        s.create_unit('Compressor', 'C' + str(k), i + 1, i + 2)
+        s.create_disjunct_unit('h2_separation_' + str(k), 'psa_' + str(k), 'PSA', 'PSA' + str(k), i + 2, i + 3, i + 4,
+                               'H2')
+        s.create_disjunct_unit('h2_separation_' + str(k), 'msp_' + str(k), 'MSP', 'MSP' + str(k), i + 2, i + 3, i + 4,
+                               'H2')
+        s.create_unit('Heat Exchanger', 'HE' + str(k), i + 4, i + 5)
+        k += 1
+
+    s.model.cog_steelMill = pe.Param(initialize=39700000000 / scale)  # in kg, scaled
+
+    s.connect_list = list(connector_flows)
+    s.model.connect_lp = pe.Var(s.connect_list, initialize=0, bounds=(-10000, 10000))
+
+    feeds = [100 * k + 1 for k in range(1, n_trains + 1)]
+    products = [100 * k + 3 for k in range(1, n_trains + 1)]
+    s.model.cog_balance = pe.Constraint(expr=0 == - s.model.cog_steelMill + s.model.connect_lp['Mill gas COG [kg]']
+                                        + sum(s.model.n[i] for i in feeds) * molar_weight('COG'))
+    s.model.h2_balance = pe.Constraint(expr=s.model.connect_lp['Hydrogen (H2) [kg]']
+                                       == sum(s.model.n[i] for i in products) * molar_weight('H2'))
+    s.model.el_balance = pe.Constraint(expr=0 == - s.model.connect_lp['Electricity [MJ]']
+                                       - sum_rule(s.model.w, s.model.workSet))
+    s.model.heat_balance = pe.Constraint(expr=0 == - s.model.connect_lp['Heat [MJ]']
+                                         - sum_rule(s.model.q, s.model.heatSet))
+    return s
+
+
+def import_synthetic_lci(s, lci):
+    """ Connects the flowsheet s to the (set up) inventory lci and finalizes the gdp, as in main_overall """
+    connector_lp = {}
+    for c in s.connect_list:
+        connector_lp[c] = s.model.connect_lp[c]
+    lci.import_connector(connector_lp)
+    lci.presolve()
+    lci.construct_demand_constraints()
+    lci.construct_objective()
+    s.import_lci(lci)
+    s.create_disjunctions()
+    return s
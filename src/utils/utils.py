@@ -30,3 +30,5 @@ class Stream():
         self.y = {}
         for k in self.substances:
             self.y[k] = y[self.i, k]
+        self.h = None  # Molar enthalpy and isentropic exponent, shared by all units (see Superstructure.create_streams)
+        self.kappa = None